@@ -1,14 +1,43 @@
 import os
 
-from flask import Flask, url_for
+import click
+from flask import Flask
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from .replicas import RoutingSession, init_replicas, replica_binds
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 
 
-def create_app():
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in {"1", "true", "yes"}
+
+
+def _engine_options(database_uri: str) -> dict:
+    """Connection pool settings from DB_POOL_* / DB_STATEMENT_TIMEOUT_MS."""
+    # Pre-ping replaces connections the server or a proxy closed while idle.
+    options = {"pool_pre_ping": _env_flag("DB_POOL_PRE_PING", True)}
+    if database_uri.startswith("sqlite"):
+        return options
+    options.update(
+        pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        pool_timeout=int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+    )
+    statement_timeout = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+    if statement_timeout and database_uri.startswith("postgresql"):
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+def create_app(warm_up: bool = False):
+    """Build the app; ``warm_up=True`` also runs :func:`app.warmup.warm_up`."""
     app = Flask(__name__)
 
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret-key")
@@ -17,10 +46,35 @@ def create_app():
         "postgresql+psycopg2://postgres:postgres@db:5432/retrofagia",
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _engine_options(
+        app.config["SQLALCHEMY_DATABASE_URI"]
+    )
+    # Read replicas for the read-only views (see app/replicas.py).
+    replica_urls = [
+        url.strip()
+        for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",")
+        if url.strip()
+    ]
+    app.config["SQLALCHEMY_BINDS"] = replica_binds(replica_urls, _engine_options)
+    app.config["REPLICA_MAX_LAG"] = float(os.environ.get("DB_REPLICA_MAX_LAG", 5))
     app.config["MAX_CONTENT_LENGTH"] = 4 * 1024 * 1024  # 4MB por arquivo
     app.config["UPLOAD_FOLDER"] = os.environ.get(
         "UPLOAD_FOLDER", os.path.join(app.root_path, "static", "uploads")
     )
+    # Materialized feed timeline (see app/timeline.py). Run
+    # scripts/rebuild_feed_timeline.py before switching it on.
+    app.config["FEED_FANOUT"] = _env_flag("FEED_FANOUT")
+
+    # "local" or "postgres"; defaults to postgres when the database is.
+    app.config["EVENT_BUS"] = os.environ.get("EVENT_BUS") or None
+    # Seconds between the shared notification poller's ticks (0 disables it);
+    # by default it only runs with the local bus. See app/poller.py.
+    poll_interval = os.environ.get("NOTIFICATION_POLL_INTERVAL")
+    app.config["NOTIFICATION_POLL_INTERVAL"] = (
+        float(poll_interval) if poll_interval else None
+    )
+    # Apply pending migrations during warm-up instead of only checking them.
+    app.config["AUTO_MIGRATE"] = _env_flag("AUTO_MIGRATE")
 
     db.init_app(app)
     login_manager.init_app(app)
@@ -28,32 +82,39 @@ def create_app():
 
     from . import models  # noqa: F401
     from .auth import auth_bp
+    from .events import init_event_bus
     from .main import main_bp
+    from .poller import init_poller
+    from .storage import image_url
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
+    init_event_bus(app)
+    init_poller(app)
+    init_replicas(app)
 
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
-    @app.before_request
-    def ensure_tables_exist():
-        # Lazy table creation keeps setup simple in development containers.
-        if not getattr(app, "_tables_created", False):
-            db.create_all()
-            app._tables_created = True
-
     @app.template_filter("image_url")
-    def image_url_filter(value: str):
-        if not value:
-            return ""
-        if value.startswith("http://") or value.startswith("https://"):
-            return value
-        return url_for("static", filename=value)
+    def image_url_filter(value: str, size: int | None = None):
+        return image_url(value, size)
 
     @app.route("/health")
     def health():
         return {"status": "ok"}
 
+    from .warmup import warm_up as run_warm_up
+
+    @app.cli.command("warm-up")
+    @click.option("--migrate", is_flag=True, help="Aplica migrações pendentes.")
+    def warm_up_command(migrate):
+        """Prepara schema, pool de conexões, templates e índices em memória."""
+        run_warm_up(app, auto_migrate=migrate or None)
+        click.echo("Warm-up concluído.")
+
+    if warm_up:
+        run_warm_up(app)
+
     return app
 
 
@@ -0,0 +1,408 @@
+"""ASGI entry point: long-poll waits and event streams on an event loop.
+
+``uvicorn --factory app.asgi:create_asgi_app`` serves the Flask app through a
+thread pool, except for three endpoints that mostly sit idle:
+
+* ``/api/notifications?wait=1`` and ``/api/chat/<id>/messages?wait=1`` run
+  their query rounds in a worker thread but await the event bus on the loop
+  in between, answering the same JSON as the Flask views;
+* ``/api/stream`` is a ``text/event-stream`` pushing chat messages and
+  notification payloads over one connection per tab. ``Last-Event-ID`` (the
+  last message id seen) replays messages missed while reconnecting.
+
+``/ws/chat`` is a WebSocket for the chat page: ``{"type": "send", "to": id,
+"content": "..."}`` frames are stored like the form POST and every message
+of the user is pushed back as ``{"type": "message", ...}``. Fan-out goes
+through the event bus, so the ``postgres`` backend shares rooms across
+processes and delivery never polls the database.
+
+An open chat window therefore no longer pins a worker thread.
+"""
+
+import asyncio
+import io
+import json
+import re
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import Flask, request
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+
+from . import create_app, db
+from .events import current_bus, user_topic
+from .main import (
+    _can_message,
+    _chat_snapshot,
+    _chat_target,
+    _message_event,
+    _messages_after,
+    _notifications_snapshot,
+    _parse_iso,
+    _poll_timeout,
+    _quiet_notifications,
+    _send_message,
+)
+from .models import Message, User
+from .replicas import use_replica
+
+# Threads for the regular (synchronous) Flask requests.
+WSGI_WORKERS = 16
+# Comment lines keep proxies from closing idle streams.
+KEEPALIVE_SECONDS = 15
+# Messages replayed at most when a stream resumes from Last-Event-ID.
+REPLAY_LIMIT = 200
+RECONNECT_MS = 3000
+
+NOTIFICATIONS_PATH = "/api/notifications"
+STREAM_PATH = "/api/stream"
+CHAT_SOCKET_PATH = "/ws/chat"
+CHAT_MESSAGES_PATH = re.compile(r"^/api/chat/(\d+)/messages$")
+
+
+class LongPollApp:
+    def __init__(self, flask_app: Flask) -> None:
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=WSGI_WORKERS)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "websocket" and scope["path"] == CHAT_SOCKET_PATH:
+            await self._chat_socket(scope, receive, send)
+            return
+        if scope["type"] == "http" and scope["method"] == "GET":
+            if scope["path"] == STREAM_PATH:
+                await self._stream(scope, receive, send)
+                return
+            route = self._long_poll_route(scope)
+            if route is not None:
+                await self._long_poll(scope, receive, send, *route)
+                return
+        await self.wsgi(scope, receive, send)
+
+    @staticmethod
+    def _long_poll_route(scope) -> tuple[str, int | None] | None:
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        if query.get("wait") != ["1"]:
+            return None
+        if scope["path"] == NOTIFICATIONS_PATH:
+            return "notifications", None
+        match = CHAT_MESSAGES_PATH.match(scope["path"])
+        if match and query.get("after"):
+            return "chat", int(match.group(1))
+        return None
+
+    async def _long_poll(self, scope, receive, send, kind, contact_id) -> None:
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, io.BytesIO())
+        started = time.monotonic()
+
+        first = await asyncio.to_thread(
+            self._snapshot, environ, kind, contact_id, loop, None
+        )
+        if first is None:
+            # Anonymous or forbidden: Flask answers those without waiting.
+            await self.wsgi(scope, receive, send)
+            return
+
+        subscription, payload, has_news, timeout = first
+        deadline = started + timeout
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            while not has_news and time.monotonic() < deadline:
+                events = await _wait_unless_disconnected(
+                    subscription, deadline - time.monotonic(), disconnected
+                )
+                if events is None:
+                    return
+                if not events:
+                    if kind == "notifications":
+                        payload = _quiet_notifications(payload)
+                    break
+                again = await asyncio.to_thread(
+                    self._snapshot, environ, kind, contact_id, loop, subscription
+                )
+                if again is None:
+                    await self.wsgi(scope, receive, send)
+                    return
+                _, payload, has_news, _ = again
+        finally:
+            subscription.close()
+            disconnected.cancel()
+
+        body = self.flask_app.json.dumps(payload).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def _snapshot(self, environ, kind, contact_id, loop, subscription):
+        """Run one query round inside a Flask request context (worker thread).
+
+        Subscribes on the first round, before querying, so events committed
+        between the query and the wait are not lost. Only the first chat round
+        may read from a replica (its ``after`` id cursor just retries what a
+        lagging replica lacks); later ones were woken by an event and read the
+        primary, which is guaranteed to have its rows. Notifications always
+        read the primary: their ``since`` cursor moves to ``server_time``, so
+        rows a replica had not replayed yet would be skipped for good.
+        """
+        with self.flask_app.request_context(environ):
+            if subscription is None and kind == "chat":
+                use_replica()
+            if not current_user.is_authenticated:
+                return None
+            try:
+                target = _chat_target(contact_id) if kind == "chat" else None
+            except HTTPException:
+                if subscription is not None:
+                    subscription.close()
+                return None
+            if subscription is None:
+                subscription = current_bus().subscribe_async(
+                    loop, user_topic(current_user.id)
+                )
+            if kind == "chat":
+                after_id = request.args.get("after", type=int)
+                payload, has_news = _chat_snapshot(target, after_id)
+            else:
+                payload, has_news = _notifications_snapshot(
+                    _parse_iso(request.args.get("since")),
+                    request.args.get("unread_snapshot", type=int),
+                )
+            return subscription, payload, has_news, _poll_timeout()
+
+    async def _stream(self, scope, receive, send) -> None:
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, io.BytesIO())
+        opened = await asyncio.to_thread(self._open_stream, environ, loop)
+        if opened is None:
+            await send({"type": "http.response.start", "status": 401, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        user_id, subscription, replay = opened
+        since = datetime.now(timezone.utc)
+        last_id = 0
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"text/event-stream"),
+                        (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no"),
+                    ],
+                }
+            )
+            await self._push(send, f"retry: {RECONNECT_MS}\n\n")
+            for message in replay:
+                await self._push_message(send, message)
+                last_id = message["id"]
+
+            while True:
+                events = await _wait_unless_disconnected(
+                    subscription, KEEPALIVE_SECONDS, disconnected
+                )
+                if events is None:
+                    return
+                if not events:
+                    await self._push(send, ": keepalive\n\n")
+                    continue
+
+                refresh_notifications = False
+                for _, data in events:
+                    kind = data.get("kind")
+                    if kind == "message":
+                        if data["id"] <= last_id:
+                            continue
+                        if data.get("truncated"):
+                            data = await asyncio.to_thread(
+                                self._load_message, environ, data["id"]
+                            )
+                            if data is None:
+                                continue
+                        await self._push_message(send, data)
+                        last_id = data["id"]
+                        if data["receiver_id"] == user_id:
+                            refresh_notifications = True
+                    elif kind in {"follow", "read"}:
+                        refresh_notifications = True
+
+                if refresh_notifications:
+                    payload = await asyncio.to_thread(
+                        self._notifications, environ, since
+                    )
+                    if payload is None:
+                        return
+                    since = _parse_iso(payload["server_time"]) or since
+                    await self._push(send, self._event("notifications", payload))
+        finally:
+            subscription.close()
+            disconnected.cancel()
+
+    def _open_stream(self, environ, loop):
+        with self.flask_app.request_context(environ):
+            if not current_user.is_authenticated:
+                return None
+            subscription = current_bus().subscribe_async(
+                loop, user_topic(current_user.id)
+            )
+            replay = []
+            last_event_id = request.headers.get("Last-Event-ID", type=int)
+            if last_event_id is not None:
+                replay = [
+                    _message_event(message)
+                    for message in _messages_after(
+                        current_user.id, last_event_id, REPLAY_LIMIT
+                    )
+                ]
+            return current_user.id, subscription, replay
+
+    def _notifications(self, environ, since: datetime) -> dict | None:
+        with self.flask_app.request_context(environ):
+            if not current_user.is_authenticated:
+                return None
+            payload, _ = _notifications_snapshot(since, None)
+            return payload
+
+    def _load_message(self, environ, message_id: int) -> dict | None:
+        with self.flask_app.request_context(environ):
+            message = db.session.get(Message, message_id)
+            return _message_event(message) if message else None
+
+    async def _push_message(self, send, message: dict) -> None:
+        await self._push(send, self._event("message", message, message["id"]))
+
+    async def _chat_socket(self, scope, receive, send) -> None:
+        loop = asyncio.get_running_loop()
+        environ = build_environ(
+            dict(scope, method="GET", http_version=scope.get("http_version", "1.1")),
+            io.BytesIO(),
+        )
+        if (await receive())["type"] != "websocket.connect":
+            return
+        opened = None
+        if _same_origin(environ):
+            opened = await asyncio.to_thread(self._open_socket, environ, loop)
+        if opened is None:
+            await send({"type": "websocket.close", "code": 4401})
+            return
+
+        subscription = opened
+        await send({"type": "websocket.accept"})
+        send_lock = asyncio.Lock()
+
+        async def reply(frame: dict) -> None:
+            async with send_lock:
+                await send(
+                    {"type": "websocket.send", "text": self.flask_app.json.dumps(frame)}
+                )
+
+        pump = asyncio.ensure_future(self._pump_messages(environ, subscription, reply))
+        try:
+            while True:
+                event = await receive()
+                if event["type"] == "websocket.disconnect":
+                    return
+                if event["type"] != "websocket.receive":
+                    continue
+                try:
+                    frame = json.loads(event.get("text") or "")
+                except ValueError:
+                    continue
+                if not isinstance(frame, dict) or frame.get("type") != "send":
+                    continue
+                error = await asyncio.to_thread(
+                    self._send_from_socket, environ, frame.get("to"), frame.get("content")
+                )
+                if error:
+                    await reply({"type": "error", "error": error})
+        finally:
+            pump.cancel()
+            subscription.close()
+
+    def _open_socket(self, environ, loop):
+        with self.flask_app.request_context(environ):
+            if not current_user.is_authenticated:
+                return None
+            return current_bus().subscribe_async(loop, user_topic(current_user.id))
+
+    async def _pump_messages(self, environ, subscription, reply) -> None:
+        while True:
+            for _, data in await subscription.wait_async(KEEPALIVE_SECONDS):
+                if data.get("kind") != "message":
+                    continue
+                if data.get("truncated"):
+                    data = await asyncio.to_thread(
+                        self._load_message, environ, data["id"]
+                    )
+                    if data is None:
+                        continue
+                await reply(dict(data, type="message"))
+
+    def _send_from_socket(self, environ, recipient_id, content) -> str | None:
+        """Store a message sent over the socket; return an error text if refused."""
+        content = content.strip() if isinstance(content, str) else ""
+        if not isinstance(recipient_id, int) or not content:
+            return "Selecione um destinatário e escreva uma mensagem."
+        with self.flask_app.request_context(environ):
+            if not current_user.is_authenticated:
+                return "Sessão expirada."
+            recipient = db.session.get(User, recipient_id)
+            if not recipient:
+                return "Usuário não encontrado."
+            if not _can_message(recipient):
+                return "Você só pode enviar mensagens para seguidores ou seguidos."
+            _send_message(recipient, content)
+            return None
+
+    def _event(self, name: str, data: dict, event_id: int | None = None) -> str:
+        lines = [] if event_id is None else [f"id: {event_id}"]
+        lines.append(f"event: {name}")
+        lines.append(f"data: {self.flask_app.json.dumps(data)}")
+        return "\n".join(lines) + "\n\n"
+
+    @staticmethod
+    async def _push(send, chunk: str) -> None:
+        await send(
+            {"type": "http.response.body", "body": chunk.encode(), "more_body": True}
+        )
+
+
+def _same_origin(environ) -> bool:
+    """Browsers send cookies on cross-site WebSocket handshakes; refuse those."""
+    origin = environ.get("HTTP_ORIGIN")
+    return not origin or urlsplit(origin).netloc == environ.get("HTTP_HOST")
+
+
+async def _wait_for_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _wait_unless_disconnected(subscription, timeout, disconnected):
+    """Events delivered within ``timeout``, or ``None`` once the client left."""
+    waiting = asyncio.ensure_future(subscription.wait_async(timeout))
+    await asyncio.wait({waiting, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    if disconnected.done():
+        waiting.cancel()
+        return None
+    return waiting.result()
+
+
+def create_asgi_app(flask_app: Flask | None = None) -> LongPollApp:
+    """Uvicorn factory; the app is warmed up before the worker takes traffic."""
+    return LongPollApp(flask_app or create_app(warm_up=True))
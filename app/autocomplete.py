@@ -0,0 +1,184 @@
+"""In-process prefix index for the album autocomplete endpoint.
+
+``/api/albums/search`` runs on every debounced keystroke, so it is answered
+from memory: a sorted array of normalized word-suffixes of every album master
+(searched with ``bisect``) plus a small per-user cache of owned masters. Both
+are updated in place by the album write paths of this process and fully
+reloaded every ``REFRESH_SECONDS`` to pick up writes made by other workers.
+One request per process runs that reload; the others keep answering from the
+stale index meanwhile.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from sqlalchemy import func
+
+from . import db
+from .catalog import normalize_key
+from .models import Album, AlbumMaster
+
+REFRESH_SECONDS = 300
+OWNED_CACHE_SIZE = 1024
+OWNED_CACHE_SECONDS = 120
+
+
+def _suffixes(master: AlbumMaster) -> set[str]:
+    """Every word-suffix of the title and artist, e.g. "side of the moon"."""
+    tokens = set()
+    for key in (master.title_key, master.artist_key):
+        words = key.split()
+        for start in range(len(words)):
+            tokens.add(" ".join(words[start:]))
+    return tokens
+
+
+class AlbumPrefixIndex:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Held by the one request reloading the catalog.
+        self._reload_lock = threading.Lock()
+        self._entries: list[tuple[str, int]] = []
+        self._masters: dict[int, dict] = {}
+        self._loaded_at: float | None = None
+
+    def _is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at > REFRESH_SECONDS
+
+    def _ensure_fresh(self) -> None:
+        if self._loaded_at is None:
+            # Nothing to answer from yet: wait for whoever is loading it.
+            with self._reload_lock:
+                if self._loaded_at is None:
+                    self.reload()
+            return
+        if not self._is_stale() or not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            if self._is_stale():
+                self.reload()
+        finally:
+            self._reload_lock.release()
+
+    def reload(self) -> None:
+        rows = (
+            db.session.query(AlbumMaster, func.min(Album.id))
+            .join(Album, Album.master_id == AlbumMaster.id)
+            .group_by(AlbumMaster.id)
+            .all()
+        )
+        entries, masters = [], {}
+        for master, album_id in rows:
+            masters[master.id] = self._payload(master, album_id)
+            entries.extend((token, master.id) for token in _suffixes(master))
+        entries.sort()
+        with self._lock:
+            self._entries, self._masters = entries, masters
+            self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _payload(master: AlbumMaster, album_id: int) -> dict:
+        return {
+            "master_id": master.id,
+            "album_id": album_id,
+            "title": master.title,
+            "artist": master.artist,
+            "title_key": master.title_key,
+            "cover_url": master.cover_url,
+        }
+
+    def search(self, term: str, limit: int) -> list[dict]:
+        """Masters with a word-suffix starting with ``term``; title prefixes first."""
+        self._ensure_fresh()
+        term = normalize_key(term)
+        matches: dict[int, dict] = {}
+        with self._lock:
+            position = bisect_left(self._entries, (term, -1))
+            while position < len(self._entries) and len(matches) < limit * 5:
+                token, master_id = self._entries[position]
+                if not token.startswith(term):
+                    break
+                matches.setdefault(master_id, self._masters[master_id])
+                position += 1
+        ranked = sorted(
+            matches.values(),
+            key=lambda item: (not item["title_key"].startswith(term), -item["master_id"]),
+        )
+        return ranked[:limit]
+
+    def add(self, master: AlbumMaster, album_id: int) -> None:
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            if master.id in self._masters:
+                return
+            self._masters[master.id] = self._payload(master, album_id)
+            for token in _suffixes(master):
+                insort(self._entries, (token, master.id))
+
+    def update_cover(self, master: AlbumMaster) -> None:
+        with self._lock:
+            if master.id in self._masters:
+                self._masters[master.id]["cover_url"] = master.cover_url
+
+    def discard_album(self, master_id: int, album_id: int) -> None:
+        """Forget a deleted copy, re-pointing or dropping its master."""
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            payload = self._masters.get(master_id)
+        if not payload or payload["album_id"] != album_id:
+            return
+        remaining = (
+            db.session.query(func.min(Album.id)).filter(Album.master_id == master_id).scalar()
+        )
+        with self._lock:
+            if remaining:
+                payload["album_id"] = remaining
+                return
+            self._masters.pop(master_id, None)
+            self._entries = [entry for entry in self._entries if entry[1] != master_id]
+
+
+class OwnedAlbumsCache:
+    """Small LRU of ``user_id -> {master_id}`` with a short TTL."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, tuple[float, set[int]]] = OrderedDict()
+
+    def get(self, user_id: int) -> set[int]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached and now - cached[0] < OWNED_CACHE_SECONDS:
+                self._entries.move_to_end(user_id)
+                return cached[1]
+        owned = {
+            master_id
+            for (master_id,) in db.session.query(Album.master_id)
+            .filter(Album.user_id == user_id, Album.master_id.isnot(None))
+            .all()
+        }
+        with self._lock:
+            self._entries[user_id] = (now, owned)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > OWNED_CACHE_SIZE:
+                self._entries.popitem(last=False)
+        return owned
+
+    def add(self, user_id: int, master_id: int) -> None:
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached:
+                cached[1].add(master_id)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+album_index = AlbumPrefixIndex()
+owned_albums = OwnedAlbumsCache()
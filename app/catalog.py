@@ -0,0 +1,220 @@
+"""Canonical album catalog.
+
+Every per-user ``Album`` points at an ``AlbumMaster`` identified by its
+normalized ``(title, artist)`` signature, so "the same album" is a single
+integer key instead of a ``lower(title)``/``lower(artist)`` comparison.
+"""
+
+from collections import Counter
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import Album, AlbumMaster, AlbumStats, Review
+
+CLUSTER_BATCH_SIZE = 500
+
+
+def normalize_key(value: str) -> str:
+    return (value or "").strip().lower()
+
+
+def master_for_signature(title: str, artist: str) -> AlbumMaster:
+    """Return the master for ``title``/``artist``, creating it if needed."""
+    title_key, artist_key = normalize_key(title), normalize_key(artist)
+    master = AlbumMaster.query.filter_by(title_key=title_key, artist_key=artist_key).first()
+    if master:
+        return master
+
+    master = AlbumMaster(
+        title=title.strip(),
+        artist=artist.strip(),
+        title_key=title_key,
+        artist_key=artist_key,
+        cover_url="",
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(master)
+            db.session.flush()
+            db.session.add(AlbumStats(master_id=master.id))
+    except IntegrityError:
+        # Another request created the same signature concurrently.
+        master = AlbumMaster.query.filter_by(
+            title_key=title_key, artist_key=artist_key
+        ).one()
+    return master
+
+
+def master_for_album(album: Album) -> AlbumMaster:
+    """Return ``album``'s master, attaching one if the row predates masters."""
+    if album.master is None:
+        album.master = master_for_signature(album.title, album.artist)
+    return album.master
+
+
+def set_master_cover(master: AlbumMaster, cover_url: str) -> None:
+    """Make ``cover_url`` the global cover of ``master`` and all of its copies."""
+    master.cover_url = cover_url
+    Album.query.filter_by(master_id=master.id).update(
+        {Album.cover_url: cover_url}, synchronize_session="fetch"
+    )
+
+
+def _master_reviews_total(expression, master_id, *criteria):
+    """Scalar subquery aggregating the reviews of ``master_id`` (an id or a column)."""
+    return (
+        select(expression)
+        .select_from(Review)
+        .join(Album, Review.album_id == Album.id)
+        .where(Album.master_id == master_id, *criteria)
+        .correlate_except(Review, Album)
+        .scalar_subquery()
+    )
+
+
+def _album_stats_values(master_id) -> dict:
+    values = {
+        f"rating_{value}": _master_reviews_total(
+            func.count(Review.id), master_id, Review.rating == value
+        )
+        for value in range(1, 6)
+    }
+    values["review_count"] = _master_reviews_total(func.count(Review.id), master_id)
+    values["rating_sum"] = _master_reviews_total(
+        func.coalesce(func.sum(Review.rating), 0), master_id
+    )
+    values["unique_reviewer_count"] = _master_reviews_total(
+        func.count(func.distinct(Review.user_id)), master_id
+    )
+    return values
+
+
+def album_stats_values() -> dict:
+    """``UPDATE`` values recomputing ``album_stats`` from the reviews."""
+    return _album_stats_values(AlbumStats.master_id)
+
+
+def insert_missing_album_stats() -> None:
+    """Create zeroed stats rows for every master without one. The caller commits."""
+    missing = (
+        select(AlbumMaster.id)
+        .outerjoin(AlbumStats, AlbumStats.master_id == AlbumMaster.id)
+        .where(AlbumStats.master_id.is_(None))
+    )
+    db.session.execute(insert(AlbumStats).from_select(["master_id"], missing))
+
+
+def reconcile_album_stats() -> None:
+    """Recompute every master's stats from its reviews. The caller commits."""
+    insert_missing_album_stats()
+    db.session.execute(update(AlbumStats).values(**album_stats_values()))
+
+
+def _insert_album_stats(master_id: int) -> bool:
+    """Create the stats row of ``master_id`` from its reviews; False if it exists."""
+    try:
+        with db.session.begin_nested():
+            db.session.execute(
+                insert(AlbumStats).values(
+                    master_id=master_id, **_album_stats_values(master_id)
+                )
+            )
+    except IntegrityError:
+        # A concurrent request created the row first.
+        return False
+    return True
+
+
+def apply_review_changes(master_id: int, added=(), removed=()) -> None:
+    """Count reviews rated ``added`` and uncount reviews rated ``removed``.
+
+    Called after the review write is flushed (an edit passes the old rating in
+    ``removed`` and the new one in ``added``). The totals move with a single
+    ``UPDATE ... SET x = x + n``, so concurrent writes on one master add up;
+    only the distinct-reviewer total is recounted. The caller commits.
+    """
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    values = {
+        f"rating_{value}": getattr(AlbumStats, f"rating_{value}") + delta
+        for value, delta in deltas.items()
+        if delta
+    }
+    bump = (
+        update(AlbumStats)
+        .where(AlbumStats.master_id == master_id)
+        .values(
+            review_count=AlbumStats.review_count + len(added) - len(removed),
+            rating_sum=AlbumStats.rating_sum + sum(added) - sum(removed),
+            unique_reviewer_count=_master_reviews_total(
+                func.count(func.distinct(Review.user_id)), master_id
+            ),
+            **values,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(bump).rowcount:
+        return
+    # No row yet: counting from the reviews already includes this change.
+    if not _insert_album_stats(master_id):
+        db.session.execute(bump)
+
+
+def album_stats(master_id: int) -> AlbumStats:
+    """Stored stats for ``master_id``; all zeros if the row is missing."""
+    stats = db.session.get(AlbumStats, master_id)
+    if stats is None:
+        # Not added to the session: album pages never write.
+        stats = AlbumStats(
+            master_id=master_id,
+            review_count=0,
+            unique_reviewer_count=0,
+            rating_sum=0,
+            **{f"rating_{value}": 0 for value in range(1, 6)},
+        )
+    return stats
+
+
+def cluster_album_masters(report=print) -> int:
+    """Attach every album without a master to one, in bounded batches.
+
+    The earliest copy of a signature names the master; the first copy that has
+    a global cover provides it. Returns the number of albums updated.
+    """
+    masters = {
+        (master.title_key, master.artist_key): master
+        for master in AlbumMaster.query.all()
+    }
+    updated = 0
+    while True:
+        batch = (
+            Album.query.filter(Album.master_id.is_(None))
+            .order_by(Album.created_at.asc(), Album.id.asc())
+            .limit(CLUSTER_BATCH_SIZE)
+            .all()
+        )
+        if not batch:
+            break
+        for album in batch:
+            key = (normalize_key(album.title), normalize_key(album.artist))
+            master = masters.get(key)
+            if master is None:
+                master = AlbumMaster(
+                    title=album.title.strip(),
+                    artist=album.artist.strip(),
+                    title_key=key[0],
+                    artist_key=key[1],
+                    cover_url="",
+                    created_at=album.created_at,
+                )
+                db.session.add(master)
+                masters[key] = master
+            if not master.cover_url and album.cover_url:
+                master.cover_url = album.cover_url
+            album.master = master
+        db.session.commit()
+        updated += len(batch)
+        report(f"{updated} álbuns agrupados...")
+    return updated
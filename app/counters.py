@@ -0,0 +1,262 @@
+"""Denormalized counters kept next to the rows they describe.
+
+Write paths adjust the counters with single ``UPDATE ... SET x = x + n``
+statements; the reconciliation helpers recompute them from the source tables
+in case they ever drift.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import and_, case, func, insert, literal, or_, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import (
+    ChatReadState,
+    CommentReaction,
+    Conversation,
+    Message,
+    Review,
+    ReviewComment,
+    ReviewReaction,
+)
+
+
+def reaction_deltas(previous: int | None, current: int | None) -> tuple[int, int]:
+    """Return ``(likes_delta, dislikes_delta)`` for a reaction change."""
+    likes = (current == 1) - (previous == 1)
+    dislikes = (current == -1) - (previous == -1)
+    return likes, dislikes
+
+
+def apply_reaction_deltas(model, target_id: int, likes: int, dislikes: int) -> tuple[int, int]:
+    """Atomically bump ``model``'s counters and return the new values."""
+    row = db.session.execute(
+        update(model)
+        .where(model.id == target_id)
+        .values(likes=model.likes + likes, dislikes=model.dislikes + dislikes)
+        .returning(model.likes, model.dislikes)
+        .execution_options(synchronize_session=False)
+    ).one()
+    return int(row.likes), int(row.dislikes)
+
+
+def _reaction_total(reaction_model, foreign_key, owner_model, value: int):
+    return (
+        select(func.count())
+        .select_from(reaction_model)
+        .where(foreign_key == owner_model.id, reaction_model.value == value)
+        .scalar_subquery()
+    )
+
+
+def reaction_counter_values(model) -> dict:
+    """``UPDATE`` values recomputing ``model``'s likes/dislikes (Review or ReviewComment)."""
+    if model is Review:
+        reaction_model, foreign_key = ReviewReaction, ReviewReaction.review_id
+    else:
+        reaction_model, foreign_key = CommentReaction, CommentReaction.comment_id
+    return {
+        "likes": _reaction_total(reaction_model, foreign_key, model, 1),
+        "dislikes": _reaction_total(reaction_model, foreign_key, model, -1),
+    }
+
+
+def reconcile_reaction_counters() -> None:
+    """Recompute review and comment like/dislike counters. The caller commits."""
+    for model in (Review, ReviewComment):
+        db.session.execute(update(model).values(**reaction_counter_values(model)))
+
+
+def _newer(column, message: Message):
+    return or_(column.is_(None), column < message.id)
+
+
+def _touch_conversation(
+    user_id: int, contact_id: int, message: Message, incoming: bool
+) -> None:
+    newer = _newer(Conversation.last_message_id, message)
+    values = {
+        "last_message_id": case((newer, message.id), else_=Conversation.last_message_id),
+        "last_message_at": case(
+            (newer, message.created_at), else_=Conversation.last_message_at
+        ),
+    }
+    if incoming:
+        newer = _newer(Conversation.last_incoming_message_id, message)
+        values.update(
+            last_incoming_message_id=case(
+                (newer, message.id), else_=Conversation.last_incoming_message_id
+            ),
+            last_incoming_at=case(
+                (newer, message.created_at), else_=Conversation.last_incoming_at
+            ),
+            unread_count=Conversation.unread_count + 1,
+        )
+    touch = (
+        update(Conversation)
+        .where(
+            Conversation.user_id == user_id,
+            Conversation.contact_id == contact_id,
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(touch).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(
+                Conversation(
+                    user_id=user_id,
+                    contact_id=contact_id,
+                    last_message_id=message.id,
+                    last_message_at=message.created_at,
+                    last_incoming_message_id=message.id if incoming else None,
+                    last_incoming_at=message.created_at if incoming else None,
+                    unread_count=1 if incoming else 0,
+                )
+            )
+    except IntegrityError:
+        # A concurrent request created the row first.
+        db.session.execute(touch)
+
+
+def record_message(message: Message) -> None:
+    """Update both participants' conversation rows for a flushed ``message``."""
+    _touch_conversation(message.sender_id, message.receiver_id, message, False)
+    _touch_conversation(message.receiver_id, message.sender_id, message, True)
+
+
+def count_unread(user_id: int, contact_id: int, read_at: datetime | None) -> int:
+    """Messages from ``contact_id`` to ``user_id`` newer than ``read_at``."""
+    query = select(func.count(Message.id)).where(
+        Message.receiver_id == user_id, Message.sender_id == contact_id
+    )
+    if read_at is not None:
+        query = query.where(Message.created_at > read_at)
+    return db.session.scalar(query) or 0
+
+
+def unread_counter_values() -> dict:
+    """``UPDATE`` values recomputing ``conversations.unread_count``."""
+    read_at = (
+        select(ChatReadState.last_read_at)
+        .where(
+            ChatReadState.user_id == Conversation.user_id,
+            ChatReadState.contact_id == Conversation.contact_id,
+        )
+        .correlate_except(ChatReadState)
+        .scalar_subquery()
+    )
+    total = (
+        select(func.count(Message.id))
+        .where(
+            Message.receiver_id == Conversation.user_id,
+            Message.sender_id == Conversation.contact_id,
+            Message.created_at > func.coalesce(read_at, datetime(1970, 1, 1)),
+        )
+        .scalar_subquery()
+    )
+    return {"unread_count": total}
+
+
+def last_message_values() -> dict:
+    """``UPDATE`` values recomputing ``conversations.last_message_*``."""
+    last_id = (
+        select(func.max(Message.id))
+        .where(
+            or_(
+                and_(
+                    Message.sender_id == Conversation.user_id,
+                    Message.receiver_id == Conversation.contact_id,
+                ),
+                and_(
+                    Message.sender_id == Conversation.contact_id,
+                    Message.receiver_id == Conversation.user_id,
+                ),
+            )
+        )
+        .correlate_except(Message)
+        .scalar_subquery()
+    )
+    last_at = select(Message.created_at).where(Message.id == last_id).scalar_subquery()
+    return {"last_message_id": last_id, "last_message_at": last_at}
+
+
+def last_incoming_values() -> dict:
+    """``UPDATE`` values recomputing ``conversations.last_incoming_*``."""
+    last_id = (
+        select(func.max(Message.id))
+        .where(
+            Message.sender_id == Conversation.contact_id,
+            Message.receiver_id == Conversation.user_id,
+        )
+        .correlate_except(Message)
+        .scalar_subquery()
+    )
+    last_at = select(Message.created_at).where(Message.id == last_id).scalar_subquery()
+    return {"last_incoming_message_id": last_id, "last_incoming_at": last_at}
+
+
+def reconcile_conversations() -> None:
+    """Recompute the ``conversations`` summaries. The caller commits."""
+    insert_missing_conversations()
+    db.session.execute(
+        update(Conversation).values(
+            **last_message_values(), **last_incoming_values(), **unread_counter_values()
+        )
+    )
+
+
+def insert_missing_conversations() -> None:
+    """Create conversation rows (unread and last incoming message not yet set)
+    for every pair that exchanged messages but has none. The caller commits."""
+    directions = union_all(
+        select(
+            Message.sender_id.label("user_id"),
+            Message.receiver_id.label("contact_id"),
+            Message.id.label("message_id"),
+        ),
+        select(Message.receiver_id, Message.sender_id, Message.id),
+    ).subquery()
+    latest = (
+        select(
+            directions.c.user_id,
+            directions.c.contact_id,
+            func.max(directions.c.message_id).label("message_id"),
+        )
+        .group_by(directions.c.user_id, directions.c.contact_id)
+        .subquery()
+    )
+    missing = (
+        select(
+            latest.c.user_id,
+            latest.c.contact_id,
+            latest.c.message_id,
+            Message.created_at,
+            literal(0),
+        )
+        .select_from(latest)
+        .join(Message, Message.id == latest.c.message_id)
+        .outerjoin(
+            Conversation,
+            and_(
+                Conversation.user_id == latest.c.user_id,
+                Conversation.contact_id == latest.c.contact_id,
+            ),
+        )
+        .where(Conversation.user_id.is_(None))
+    )
+    db.session.execute(
+        insert(Conversation).from_select(
+            [
+                "user_id",
+                "contact_id",
+                "last_message_id",
+                "last_message_at",
+                "unread_count",
+            ],
+            missing,
+        )
+    )
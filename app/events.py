@@ -0,0 +1,262 @@
+"""Commit-aware event bus used to wake long-polling requests.
+
+Write paths call :func:`publish_on_commit` with a topic such as ``user:42``.
+Waiters hold a :class:`Subscription` and block on it instead of polling the
+database. Two backends exist:
+
+* ``local`` dispatches in-process right after the session commits. Enough for
+  a single app process.
+* ``postgres`` issues ``pg_notify`` inside the same transaction (PostgreSQL
+  only delivers it if the transaction commits) and a background ``LISTEN``
+  thread dispatches to this process's subscribers, so every app process sees
+  every event.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from . import db
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "retrofagia_events"
+PENDING_KEY = "pending_events"
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more.
+MAX_NOTIFY_PAYLOAD = 7500
+
+
+USER_TOPIC_PREFIX = "user:"
+
+
+def user_topic(user_id: int) -> str:
+    return f"{USER_TOPIC_PREFIX}{user_id}"
+
+
+class Subscription:
+    """Buffers events for a set of topics until the owner waits for them."""
+
+    def __init__(self, bus: "EventBus", topics: list[str]) -> None:
+        self._bus = bus
+        self.topics = topics
+        self._events: deque = deque()
+        self._condition = threading.Condition()
+
+    def deliver(self, topic: str, data: dict) -> None:
+        with self._condition:
+            self._events.append((topic, data))
+            self._condition.notify_all()
+
+    def wait(self, timeout: float) -> list[tuple[str, dict]]:
+        """Block up to ``timeout`` seconds; return (and clear) buffered events."""
+        deadline = time.monotonic() + max(timeout, 0)
+        with self._condition:
+            while not self._events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def close(self) -> None:
+        self._bus.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class AsyncSubscription(Subscription):
+    """Subscription awaited from an asyncio loop instead of a blocked thread."""
+
+    def __init__(
+        self, bus: "EventBus", topics: list[str], loop: asyncio.AbstractEventLoop
+    ) -> None:
+        super().__init__(bus, topics)
+        self._loop = loop
+        self._ready = asyncio.Event()
+
+    def deliver(self, topic: str, data: dict) -> None:
+        super().deliver(topic, data)
+        # Delivery happens on a committing request thread or the LISTEN thread.
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def wait_async(self, timeout: float) -> list[tuple[str, dict]]:
+        try:
+            await asyncio.wait_for(self._ready.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+        self._ready.clear()
+        with self._condition:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+
+class EventBus:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: dict[str, set[Subscription]] = {}
+        # Optional app.poller.NotificationPoller, started with the first waiter.
+        self.poller = None
+
+    def subscribe(self, *topics: str) -> Subscription:
+        return self._register(Subscription(self, list(topics)))
+
+    def subscribe_async(
+        self, loop: asyncio.AbstractEventLoop, *topics: str
+    ) -> AsyncSubscription:
+        return self._register(AsyncSubscription(self, list(topics), loop))
+
+    def _register(self, subscription: Subscription) -> Subscription:
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        if self.poller is not None:
+            self.poller.ensure_running()
+        return subscription
+
+    def watched_user_ids(self) -> list[int]:
+        """Users with at least one waiter in this process."""
+        with self._lock:
+            topics = list(self._subscribers)
+        return [
+            int(topic[len(USER_TOPIC_PREFIX):])
+            for topic in topics
+            if topic.startswith(USER_TOPIC_PREFIX)
+        ]
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for topic in subscription.topics:
+                waiters = self._subscribers.get(topic)
+                if waiters is None:
+                    continue
+                waiters.discard(subscription)
+                if not waiters:
+                    del self._subscribers[topic]
+
+    def dispatch(self, topic: str, data: dict) -> None:
+        with self._lock:
+            waiters = list(self._subscribers.get(topic, ()))
+        for subscription in waiters:
+            subscription.deliver(topic, data)
+
+    def stage(self, session: Session, topic: str, data: dict) -> None:
+        """Arrange for ``topic``/``data`` to be published when ``session`` commits."""
+        session.info.setdefault(PENDING_KEY, []).append((topic, data))
+
+
+class LocalEventBus(EventBus):
+    """In-process bus: events only reach waiters of the publishing process."""
+
+
+class PostgresEventBus(EventBus):
+    """Cross-process bus on top of PostgreSQL ``LISTEN``/``NOTIFY``."""
+
+    def __init__(self, database_uri: str) -> None:
+        super().__init__()
+        self._database_uri = database_uri
+        self._listener: threading.Thread | None = None
+
+    def stage(self, session: Session, topic: str, data: dict) -> None:
+        payload = json.dumps({"topic": topic, "data": data})
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+            # Keep only the identifiers; receivers reload the rest.
+            slim = {key: data[key] for key in ("kind", "id") if key in data}
+            payload = json.dumps({"topic": topic, "data": dict(slim, truncated=True)})
+        session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": CHANNEL, "payload": payload},
+        )
+
+    def _register(self, subscription: Subscription) -> Subscription:
+        self._ensure_listener()
+        return super()._register(subscription)
+
+    def _ensure_listener(self) -> None:
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(
+                target=self._listen_forever, name="event-bus-listener", daemon=True
+            )
+            self._listener.start()
+
+    def _listen_forever(self) -> None:
+        engine = create_engine(self._database_uri, poolclass=NullPool)
+        while True:
+            try:
+                self._listen(engine)
+            except Exception:  # noqa: BLE001 - keep the listener alive
+                log.exception("Event bus listener lost its connection; retrying.")
+                time.sleep(2)
+
+    def _listen(self, engine) -> None:
+        connection = engine.raw_connection()
+        try:
+            raw = connection.driver_connection
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL};")
+            while True:
+                if select.select([raw], [], [], 30) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    notification = raw.notifies.pop(0)
+                    try:
+                        message = json.loads(notification.payload)
+                    except ValueError:
+                        continue
+                    self.dispatch(message["topic"], message.get("data") or {})
+        finally:
+            connection.close()
+
+
+def init_event_bus(app) -> EventBus:
+    backend = app.config.get("EVENT_BUS")
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    if backend is None:
+        backend = "postgres" if uri.startswith("postgresql") else "local"
+    bus = PostgresEventBus(uri) if backend == "postgres" else LocalEventBus()
+    app.extensions["event_bus"] = bus
+    return bus
+
+
+def current_bus() -> EventBus:
+    return current_app.extensions["event_bus"]
+
+
+def publish_on_commit(topic: str, data: dict | None = None) -> None:
+    """Publish an event once the current ``db.session`` transaction commits."""
+    current_bus().stage(db.session(), topic, data or {})
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_pending(session: Session) -> None:
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    bus = current_bus()
+    for topic, data in pending:
+        bus.dispatch(topic, data)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_pending(session: Session, previous_transaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
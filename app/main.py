@@ -1,25 +1,30 @@
 import time
+from contextlib import nullcontext
 from datetime import datetime, timezone
 from itertools import chain
 
 from flask import (
     Blueprint,
     abort,
+    current_app,
     flash,
     jsonify,
     redirect,
     render_template,
     request,
+    send_from_directory,
     url_for,
 )
 from flask_login import current_user, login_required
-from sqlalchemy import and_, case, func, or_
-from sqlalchemy.orm import joinedload, aliased
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import joinedload
 
 from . import db
 from .models import (
     Album,
     ChatReadState,
+    Conversation,
+    FeedEntry,
     Follow,
     Message,
     Review,
@@ -28,10 +33,54 @@ from .models import (
     CommentReaction,
     User,
 )
-from .storage import clone_image, delete_image, save_image
+from .autocomplete import album_index, owned_albums
+from .catalog import (
+    album_stats,
+    apply_review_changes,
+    master_for_album,
+    master_for_signature,
+    set_master_cover,
+)
+from .counters import (
+    apply_reaction_deltas,
+    count_unread,
+    reaction_deltas,
+    record_message,
+)
+from .events import current_bus, publish_on_commit, user_topic
+from .replicas import replica_reads, use_primary
+from .search import search_album_masters, search_users
+from .storage import (
+    THUMBNAIL_SIZES,
+    clone_image,
+    delete_image,
+    ensure_variant,
+    image_url,
+    is_upload,
+    save_image,
+)
+from .timeline import (
+    backfill_follow,
+    fan_out_review,
+    fanout_enabled,
+    prune_follow,
+    timeline_query,
+)
+from .user_cache import contact_ids, following_ids, forget_follow, forget_user
 
 main_bp = Blueprint("main", __name__, template_folder="templates")
 
+FEED_PAGE_SIZE = 10
+ALBUM_REVIEWS_PAGE_SIZE = 10
+CHAT_PAGE_SIZE = 50
+# Followers / senders per notifications response; ?followers_limit= and
+# ?messages_limit= pick a value up to the maximum.
+NOTIFICATIONS_LIMIT = 20
+NOTIFICATIONS_MAX_LIMIT = 100
+COMMENT_PREVIEW_LIMIT = 5
+# Derivatives never change (uploads get a new name), so browsers keep them.
+IMAGE_VARIANT_MAX_AGE = 30 * 24 * 3600
+
 
 def _to_utc_iso(dt: datetime) -> str:
     """Format datetimes as ISO strings with Z suffix."""
@@ -59,74 +108,139 @@ def _parse_iso(value: str | None) -> datetime | None:
     return parsed
 
 
-def _image_url(value: str | None) -> str:
-    if not value:
-        return ""
-    if value.startswith("http://") or value.startswith("https://"):
-        return value
-    return url_for("static", filename=value)
+def _encode_cursor(created_at: datetime, item_id: int) -> str:
+    """Build an opaque keyset cursor from a ``(created_at, id)`` pair."""
+    return f"{_to_utc_iso(created_at)}_{item_id}"
 
 
-def _review_reaction_maps(review_ids: list[int]) -> tuple[dict[int, dict[str, int]], dict[int, int]]:
-    counts = {review_id: {"likes": 0, "dislikes": 0} for review_id in review_ids}
-    if not review_ids:
-        return counts, {}
+def _decode_cursor(value: str | None) -> tuple[datetime, int] | None:
+    if not value or "_" not in value:
+        return None
+    raw_created_at, raw_id = value.rsplit("_", 1)
+    created_at = _parse_iso(raw_created_at)
+    try:
+        item_id = int(raw_id)
+    except ValueError:
+        return None
+    if created_at is None:
+        return None
+    # Columns store naive UTC timestamps.
+    return created_at.replace(tzinfo=None), item_id
 
-    aggregates = (
-        db.session.query(
-            ReviewReaction.review_id,
-            func.sum(case((ReviewReaction.value == 1, 1), else_=0)).label("likes"),
-            func.sum(case((ReviewReaction.value == -1, 1), else_=0)).label("dislikes"),
+
+def _apply_keyset(query, created_column, id_column, cursor: tuple[datetime, int] | None):
+    """Restrict an ordered query to rows strictly older than ``cursor``."""
+    if cursor is None:
+        return query
+    created_at, item_id = cursor
+    return query.filter(
+        or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < item_id),
         )
-        .filter(ReviewReaction.review_id.in_(review_ids))
-        .group_by(ReviewReaction.review_id)
+    )
+
+
+def _keyset_page(
+    query, created_column, id_column, cursor: tuple[datetime, int] | None, page_size: int
+) -> tuple[list, str | None]:
+    """Fetch one newest-first page of ``query`` and the cursor for the next one."""
+    rows = (
+        _apply_keyset(query, created_column, id_column, cursor)
+        .order_by(created_column.desc(), id_column.desc())
+        .limit(page_size + 1)
         .all()
     )
-    for row in aggregates:
-        counts[row.review_id] = {
-            "likes": int(row.likes or 0),
-            "dislikes": int(row.dislikes or 0),
-        }
+    page = rows[:page_size]
+    next_cursor = None
+    if len(rows) > page_size:
+        last = page[-1]
+        next_cursor = _encode_cursor(last.created_at, last.id)
+    return page, next_cursor
+
+
+def _review_reaction_maps(
+    reviews: list[Review],
+) -> tuple[dict[int, dict[str, int]], dict[int, int]]:
+    counts = {
+        review.id: {"likes": review.likes, "dislikes": review.dislikes}
+        for review in reviews
+    }
+    if not reviews:
+        return counts, {}
 
     user_reactions = {
         row.review_id: row.value
         for row in ReviewReaction.query.filter_by(user_id=current_user.id)
-        .filter(ReviewReaction.review_id.in_(review_ids))
+        .filter(ReviewReaction.review_id.in_(list(counts)))
         .all()
     }
     return counts, user_reactions
 
 
-def _comment_reaction_maps(comment_ids: list[int]) -> tuple[dict[int, dict[str, int]], dict[int, int]]:
-    counts = {comment_id: {"likes": 0, "dislikes": 0} for comment_id in comment_ids}
-    if not comment_ids:
+def _comment_reaction_maps(
+    comments: list[ReviewComment],
+) -> tuple[dict[int, dict[str, int]], dict[int, int]]:
+    counts = {
+        comment.id: {"likes": comment.likes, "dislikes": comment.dislikes}
+        for comment in comments
+    }
+    if not comments:
         return counts, {}
 
-    aggregates = (
-        db.session.query(
-            CommentReaction.comment_id,
-            func.sum(case((CommentReaction.value == 1, 1), else_=0)).label("likes"),
-            func.sum(case((CommentReaction.value == -1, 1), else_=0)).label("dislikes"),
-        )
-        .filter(CommentReaction.comment_id.in_(comment_ids))
-        .group_by(CommentReaction.comment_id)
-        .all()
-    )
-    for row in aggregates:
-        counts[row.comment_id] = {
-            "likes": int(row.likes or 0),
-            "dislikes": int(row.dislikes or 0),
-        }
-
     user_reactions = {
         row.comment_id: row.value
         for row in CommentReaction.query.filter_by(user_id=current_user.id)
-        .filter(CommentReaction.comment_id.in_(comment_ids))
+        .filter(CommentReaction.comment_id.in_(list(counts)))
         .all()
     }
     return counts, user_reactions
 
 
+def _comment_previews(
+    review_ids: list[int], limit: int = COMMENT_PREVIEW_LIMIT
+) -> tuple[dict[int, list[ReviewComment]], dict[int, int]]:
+    """Load only the latest ``limit`` comments per review plus each review's total."""
+    previews: dict[int, list[ReviewComment]] = {review_id: [] for review_id in review_ids}
+    if not review_ids:
+        return previews, {}
+
+    ranked = (
+        db.session.query(
+            ReviewComment.id.label("comment_id"),
+            func.row_number()
+            .over(
+                partition_by=ReviewComment.review_id,
+                order_by=(ReviewComment.created_at.desc(), ReviewComment.id.desc()),
+            )
+            .label("position"),
+        )
+        .filter(ReviewComment.review_id.in_(review_ids))
+        .subquery()
+    )
+    comments = (
+        ReviewComment.query.options(joinedload(ReviewComment.user))
+        .join(ranked, ranked.c.comment_id == ReviewComment.id)
+        .filter(ranked.c.position <= limit)
+        .order_by(ReviewComment.created_at.asc(), ReviewComment.id.asc())
+        .all()
+    )
+    for comment in comments:
+        previews[comment.review_id].append(comment)
+
+    totals = {
+        row.review_id: int(row.total)
+        for row in db.session.query(
+            ReviewComment.review_id,
+            func.count(ReviewComment.id).label("total"),
+        )
+        .filter(ReviewComment.review_id.in_(review_ids))
+        .group_by(ReviewComment.review_id)
+        .all()
+    }
+    return previews, totals
+
+
 def _wants_json_response() -> bool:
     if request.args.get("format") == "json":
         return True
@@ -148,6 +262,7 @@ def index():
 
 
 @main_bp.route("/feed", methods=["GET", "POST"])
+@replica_reads
 @login_required
 def feed():
     if request.method == "POST":
@@ -182,7 +297,9 @@ def feed():
                         review = Review.query.filter_by(
                             user_id=current_user.id, album_id=album.id
                         ).first()
+                        previous_ratings = []
                         if review:
+                            previous_ratings = [review.rating]
                             review.rating = rating_value
                             review.content = content
                             flash("Review atualizada.", "success")
@@ -194,29 +311,19 @@ def feed():
                                 content=content,
                             )
                             db.session.add(review)
+                            if fanout_enabled():
+                                db.session.flush()
+                                fan_out_review(review)
                             flash("Review criada!", "success")
+                        db.session.flush()
+                        apply_review_changes(
+                            master_for_album(album).id,
+                            added=[rating_value],
+                            removed=previous_ratings,
+                        )
                         db.session.commit()
 
-    followed_ids = [user.id for user in current_user.following]
-    relevant_ids = list(set(chain(followed_ids, [current_user.id])))
-
-    feed_reviews = (
-        Review.query.options(
-            joinedload(Review.user),
-            joinedload(Review.album),
-            joinedload(Review.comments).joinedload(ReviewComment.user),
-        )
-        .join(User, Review.user_id == User.id)
-        .join(Album, Review.album_id == Album.id)
-        .filter(Review.user_id.in_(relevant_ids))
-        .order_by(Review.created_at.desc())
-        .all()
-    )
-
-    review_ids = [review.id for review in feed_reviews]
-    comment_ids = [comment.id for review in feed_reviews for comment in review.comments]
-    review_reaction_counts, review_user_reactions = _review_reaction_maps(review_ids)
-    comment_reaction_counts, comment_user_reactions = _comment_reaction_maps(comment_ids)
+    feed_reviews, next_cursor = _feed_page(_decode_cursor(request.args.get("cursor")))
 
     suggested_users = (
         User.query.filter(User.id != current_user.id)
@@ -228,16 +335,56 @@ def feed():
 
     return render_template(
         "feed.html",
-        reviews=feed_reviews,
         albums=current_user.albums,
         suggested_users=suggested_users,
-        review_reaction_counts=review_reaction_counts,
-        review_user_reactions=review_user_reactions,
-        comment_reaction_counts=comment_reaction_counts,
-        comment_user_reactions=comment_user_reactions,
+        next_cursor=next_cursor,
+        **_review_list_context(feed_reviews),
     )
 
 
+def _feed_page(cursor: tuple[datetime, int] | None) -> tuple[list[Review], str | None]:
+    if fanout_enabled():
+        query = timeline_query(current_user.id)
+        created_column, id_column = FeedEntry.created_at, FeedEntry.review_id
+    else:
+        relevant_ids = list(following_ids(current_user.id) | {current_user.id})
+        query = Review.query.filter(Review.user_id.in_(relevant_ids))
+        created_column, id_column = Review.created_at, Review.id
+
+    query = query.options(joinedload(Review.user), joinedload(Review.album))
+    return _keyset_page(query, created_column, id_column, cursor, FEED_PAGE_SIZE)
+
+
+def _review_list_context(reviews: list[Review]) -> dict:
+    comment_previews, comment_totals = _comment_previews([review.id for review in reviews])
+    preview_comments = list(chain.from_iterable(comment_previews.values()))
+    review_reaction_counts, review_user_reactions = _review_reaction_maps(reviews)
+    comment_reaction_counts, comment_user_reactions = _comment_reaction_maps(
+        preview_comments
+    )
+    return {
+        "reviews": reviews,
+        "comment_previews": comment_previews,
+        "comment_totals": comment_totals,
+        "review_reaction_counts": review_reaction_counts,
+        "review_user_reactions": review_user_reactions,
+        "comment_reaction_counts": comment_reaction_counts,
+        "comment_user_reactions": comment_user_reactions,
+    }
+
+
+@main_bp.route("/api/feed")
+@replica_reads
+@login_required
+def feed_page_api():
+    cursor = _decode_cursor(request.args.get("cursor"))
+    if cursor is None:
+        abort(400)
+    reviews, next_cursor = _feed_page(cursor)
+    html = render_template("_review_list.html", **_review_list_context(reviews))
+    return jsonify({"html": html, "next_cursor": next_cursor})
+
+
 @main_bp.route("/follow/<username>", methods=["POST"])
 @login_required
 def follow_user(username):
@@ -250,12 +397,21 @@ def follow_user(username):
         Follow.query.filter_by(
             follower_id=current_user.id, following_id=target.id
         ).delete()
+        if fanout_enabled():
+            prune_follow(current_user.id, target.id)
         db.session.commit()
+        forget_follow(current_user.id, target.id)
         flash(f"Você deixou de seguir {target.username}.", "success")
     else:
         follow = Follow(follower_id=current_user.id, following_id=target.id)
         db.session.add(follow)
+        if fanout_enabled():
+            backfill_follow(current_user.id, target.id)
+        publish_on_commit(
+            user_topic(target.id), {"kind": "follow", "follower_id": current_user.id}
+        )
         db.session.commit()
+        forget_follow(current_user.id, target.id)
         flash(f"Agora você segue {target.username}.", "success")
 
     return redirect(request.referrer or url_for("main.feed"))
@@ -292,6 +448,7 @@ def edit_profile():
                         delete_image(current_user.avatar_url)
                         current_user.avatar_url = new_avatar_path
                 db.session.commit()
+                forget_user(current_user.id)
                 flash("Perfil atualizado.", "success")
 
     return render_template("profile_edit.html")
@@ -315,6 +472,7 @@ def _profile_payload(user: User):
 
 
 @main_bp.route("/profile")
+@replica_reads
 @login_required
 def my_profile():
     (
@@ -323,8 +481,7 @@ def my_profile():
         follower_count,
         following_count,
     ) = _profile_payload(current_user)
-    review_ids = [review.id for review in reviews]
-    review_reaction_counts, review_user_reactions = _review_reaction_maps(review_ids)
+    review_reaction_counts, review_user_reactions = _review_reaction_maps(reviews)
     return render_template(
         "profile_view.html",
         user=current_user,
@@ -339,6 +496,7 @@ def my_profile():
 
 
 @main_bp.route("/profile/<username>")
+@replica_reads
 @login_required
 def view_profile(username):
     user = User.query.filter_by(username=username).first_or_404()
@@ -348,8 +506,7 @@ def view_profile(username):
         follower_count,
         following_count,
     ) = _profile_payload(user)
-    review_ids = [review.id for review in reviews]
-    review_reaction_counts, review_user_reactions = _review_reaction_maps(review_ids)
+    review_reaction_counts, review_user_reactions = _review_reaction_maps(reviews)
     return render_template(
         "profile_view.html",
         user=user,
@@ -364,6 +521,7 @@ def view_profile(username):
 
 
 @main_bp.route("/profile/<username>/collection")
+@replica_reads
 @login_required
 def profile_collection(username):
     user = User.query.filter_by(username=username).first_or_404()
@@ -382,6 +540,7 @@ def profile_collection(username):
 
 
 @main_bp.route("/albums")
+@replica_reads
 @login_required
 def albums():
     user_albums = (
@@ -412,32 +571,26 @@ def create_album():
                 flash(str(exc), "error")
                 return redirect(url_for("main.create_album"))
 
-        title_key = title.lower()
-        artist_key = artist.lower()
-        matching_albums = (
-            Album.query.filter(
-                func.lower(Album.title) == title_key,
-                func.lower(Album.artist) == artist_key,
-            ).all()
-        )
-        existing_global_cover = next((a.cover_url for a in matching_albums if a.cover_url), "")
-
+        master = master_for_signature(title, artist)
         album = Album(
             title=title,
             artist=artist,
-            cover_url=existing_global_cover,
+            cover_url=master.cover_url,
             personal_cover_url=personal_cover_path,
             owner=current_user,
+            master=master,
         )
         db.session.add(album)
         db.session.commit()
 
-        if not existing_global_cover and personal_cover_path:
+        if not master.cover_url and personal_cover_path:
             global_cover = clone_image(personal_cover_path) or personal_cover_path
-            for entry in matching_albums + [album]:
-                entry.cover_url = global_cover
+            set_master_cover(master, global_cover)
             db.session.commit()
 
+        album_index.add(master, album.id)
+        owned_albums.add(current_user.id, master.id)
+
         flash("Álbum adicionado à sua coleção.", "success")
         return redirect(url_for("main.albums"))
 
@@ -445,52 +598,41 @@ def create_album():
 
 
 @main_bp.route("/api/albums/search")
+@replica_reads
 @login_required
 def album_search_api():
     query = request.args.get("q", "").strip()
     if len(query) < 2:
         return jsonify(results=[])
 
-    like_query = f"%{query}%"
-    owned_pairs = {
-        (title.lower(), artist.lower())
-        for title, artist in db.session.query(Album.title, Album.artist)
-        .filter(Album.user_id == current_user.id)
-        .all()
-    }
+    owned_master_ids = owned_albums.get(current_user.id)
+    results = [
+        {
+            "id": entry["album_id"],
+            "title": entry["title"],
+            "artist": entry["artist"],
+            "cover_url": image_url(entry["cover_url"], 256),
+            "already_owned": entry["master_id"] in owned_master_ids,
+        }
+        for entry in album_index.search(query, limit=10)
+    ]
 
-    matches = (
-        Album.query.filter(
-            or_(
-                Album.title.ilike(like_query),
-                Album.artist.ilike(like_query),
-            )
-        )
-        .order_by(Album.created_at.desc())
-        .limit(40)
-        .all()
-    )
+    return jsonify(results=results)
 
-    seen = set()
-    results = []
-    for album in matches:
-        key = (album.title.lower(), album.artist.lower())
-        if key in seen:
-            continue
-        seen.add(key)
-        results.append(
-            {
-                "id": album.id,
-                "title": album.title,
-                "artist": album.artist,
-                "cover_url": _image_url(album.cover_url),
-                "already_owned": key in owned_pairs,
-            }
-        )
-        if len(results) >= 10:
-            break
 
-    return jsonify(results=results)
+def _representative_album_ids(master_ids: list[int]) -> dict[int, int]:
+    """Map each master to its oldest surviving copy (the clone source)."""
+    if not master_ids:
+        return {}
+    return {
+        row.master_id: row.album_id
+        for row in db.session.query(
+            Album.master_id, func.min(Album.id).label("album_id")
+        )
+        .filter(Album.master_id.in_(master_ids))
+        .group_by(Album.master_id)
+        .all()
+    }
 
 
 @main_bp.route("/albums/<int:album_id>/delete", methods=["POST"])
@@ -500,8 +642,17 @@ def delete_album(album_id):
     if not album:
         abort(404)
     delete_image(album.personal_cover_url)
+    master_id = album.master_id
+    # Deleted along with the album (cascade), so they are loaded anyway.
+    ratings = [review.rating for review in album.reviews]
     db.session.delete(album)
+    if master_id is not None:
+        db.session.flush()
+        apply_review_changes(master_id, removed=ratings)
     db.session.commit()
+    owned_albums.invalidate(current_user.id)
+    if master_id is not None:
+        album_index.discard_album(master_id, album_id)
     flash("Álbum removido.", "success")
     return redirect(url_for("main.albums"))
 
@@ -515,14 +666,8 @@ def clone_album(album_id):
         flash("Este álbum já está na sua coleção.", "info")
         return redirect(url_for("main.album_detail", album_id=source_album.id))
 
-    existing = (
-        Album.query.filter_by(user_id=current_user.id)
-        .filter(
-            func.lower(Album.title) == source_album.title.lower(),
-            func.lower(Album.artist) == source_album.artist.lower(),
-        )
-        .first()
-    )
+    master = master_for_album(source_album)
+    existing = Album.query.filter_by(user_id=current_user.id, master_id=master.id).first()
     if existing:
         flash("Este álbum já está na sua coleção.", "info")
         return redirect(url_for("main.album_detail", album_id=existing.id))
@@ -530,89 +675,94 @@ def clone_album(album_id):
     cloned = Album(
         title=source_album.title,
         artist=source_album.artist,
-        cover_url=source_album.cover_url,
+        cover_url=master.cover_url or source_album.cover_url,
         personal_cover_url="",
         owner=current_user,
+        master=master,
     )
     db.session.add(cloned)
     db.session.commit()
+    album_index.add(master, cloned.id)
+    owned_albums.add(current_user.id, master.id)
     flash("Álbum adicionado à sua coleção. Publique sua review no feed!", "success")
     return redirect(url_for("main.album_detail", album_id=cloned.id))
 
 
 @main_bp.route("/albums/<int:album_id>")
+@replica_reads
 @login_required
 def album_detail(album_id):
     album = Album.query.get_or_404(album_id)
+    if album.master_id is None:
+        use_primary()
+        master_for_album(album)
+        db.session.commit()
+    master = album.master
 
-    title_key = album.title.lower()
-    artist_key = album.artist.lower()
-
-    matching_albums = (
-        Album.query.filter(
-            func.lower(Album.title) == title_key,
-            func.lower(Album.artist) == artist_key,
-        ).all()
+    canonical_album = (
+        Album.query.filter_by(master_id=master.id)
+        .order_by(Album.created_at.asc(), Album.id.asc())
+        .first()
     )
-    album_ids = [a.id for a in matching_albums] or [album.id]
-    matching_albums_sorted = sorted(matching_albums, key=lambda a: a.created_at)
-    canonical_album = matching_albums_sorted[0] if matching_albums_sorted else album
-
-    reviews = (
-        Review.query.options(
-            joinedload(Review.user),
-            joinedload(Review.comments).joinedload(ReviewComment.user),
-        )
-        .filter(Review.album_id.in_(album_ids))
-        .order_by(Review.created_at.desc())
-        .all()
+    user_album = Album.query.filter_by(
+        master_id=master.id, user_id=current_user.id
+    ).first()
+    user_review = (
+        _master_reviews_query(master.id).filter(Review.user_id == current_user.id).first()
     )
-
-    review_ids = [review.id for review in reviews]
-    comment_ids = [comment.id for review in reviews for comment in review.comments]
-    review_reaction_counts, review_user_reactions = _review_reaction_maps(review_ids)
-    comment_reaction_counts, comment_user_reactions = _comment_reaction_maps(comment_ids)
-
-    avg_rating = (
-        db.session.query(func.avg(Review.rating))
-        .filter(Review.album_id.in_(album_ids))
-        .scalar()
+    reviews, next_cursor = _album_reviews_page(
+        master.id, _decode_cursor(request.args.get("cursor"))
     )
-    avg_rating = round(float(avg_rating), 1) if avg_rating else None
-    review_count = len(reviews)
-
-    user_album = next((a for a in matching_albums if a.user_id == current_user.id), None)
-    user_review = next((r for r in reviews if r.user_id == current_user.id), None)
-
-    unique_reviewer_count = len({review.user_id for review in reviews})
-
-    cover_url = None
-    if canonical_album.cover_url:
-        cover_url = canonical_album.cover_url
-    else:
-        for candidate in matching_albums_sorted:
-            if candidate.cover_url:
-                cover_url = candidate.cover_url
-                break
+    stats = album_stats(master.id)
+    cover_url = master.cover_url or None
 
     return render_template(
         "album_detail.html",
         album=album,
         cover_url=cover_url,
-        reviews=reviews,
-        avg_rating=avg_rating,
-        review_count=review_count,
+        avg_rating=stats.avg_rating,
+        review_count=stats.review_count,
+        rating_histogram=stats.histogram,
         user_album=user_album,
         user_review=user_review,
-        unique_reviewer_count=unique_reviewer_count,
+        unique_reviewer_count=stats.unique_reviewer_count,
         canonical_album_id=canonical_album.id,
-        review_reaction_counts=review_reaction_counts,
-        review_user_reactions=review_user_reactions,
-        comment_reaction_counts=comment_reaction_counts,
-        comment_user_reactions=comment_user_reactions,
+        next_cursor=next_cursor,
+        show_album=False,
+        **_review_list_context(reviews),
+    )
+
+
+def _master_reviews_query(master_id: int):
+    return Review.query.join(Album, Review.album_id == Album.id).filter(
+        Album.master_id == master_id
+    )
+
+
+def _album_reviews_page(
+    master_id: int, cursor: tuple[datetime, int] | None
+) -> tuple[list[Review], str | None]:
+    query = _master_reviews_query(master_id).options(joinedload(Review.user))
+    return _keyset_page(
+        query, Review.created_at, Review.id, cursor, ALBUM_REVIEWS_PAGE_SIZE
     )
 
 
+@main_bp.route("/api/albums/<int:album_id>/reviews")
+@replica_reads
+@login_required
+def album_reviews_api(album_id):
+    album = Album.query.get_or_404(album_id)
+    cursor = _decode_cursor(request.args.get("cursor"))
+    if album.master_id is None or cursor is None:
+        abort(400)
+    reviews, next_cursor = _album_reviews_page(album.master_id, cursor)
+    html = render_template(
+        "_review_list.html", show_album=False, **_review_list_context(reviews)
+    )
+    return jsonify({"html": html, "next_cursor": next_cursor})
+
+
 @main_bp.route("/albums/<int:album_id>/cover", methods=["POST"])
 @login_required
 def update_album_cover(album_id):
@@ -634,18 +784,18 @@ def update_album_cover(album_id):
         if not current_user.is_admin:
             delete_image(new_path)
             abort(403)
-        normalized_title = album.title.strip().lower()
-        normalized_artist = album.artist.strip().lower()
-        matching_albums = (
-            Album.query.filter(
-                func.lower(Album.title) == normalized_title,
-                func.lower(Album.artist) == normalized_artist,
-            ).all()
-        )
-        for entry in matching_albums:
-            delete_image(entry.cover_url)
-            entry.cover_url = new_path
+        master = master_for_album(album)
+        previous_covers = {master.cover_url} | {
+            cover_url
+            for (cover_url,) in db.session.query(Album.cover_url)
+            .filter(Album.master_id == master.id)
+            .distinct()
+        }
+        for cover_url in previous_covers:
+            delete_image(cover_url)
+        set_master_cover(master, new_path)
         db.session.commit()
+        album_index.update_cover(master)
         flash("Capa global atualizada para todos.", "success")
         target_id = album_id
     else:
@@ -656,30 +806,31 @@ def update_album_cover(album_id):
         delete_image(album.personal_cover_url)
         album.personal_cover_url = new_path
 
-        normalized_title = album.title.strip().lower()
-        normalized_artist = album.artist.strip().lower()
-        matching_albums = (
-            Album.query.filter(
-                func.lower(Album.title) == normalized_title,
-                func.lower(Album.artist) == normalized_artist,
-            ).all()
-        )
-        canonical_album = (
-            sorted(matching_albums, key=lambda a: a.created_at)[0]
-            if matching_albums
-            else album
-        )
-        if not canonical_album.cover_url:
-            global_clone = clone_image(new_path) or new_path
-            for entry in matching_albums:
-                entry.cover_url = global_clone
+        master = master_for_album(album)
+        if not master.cover_url:
+            set_master_cover(master, clone_image(new_path) or new_path)
         db.session.commit()
+        album_index.update_cover(master)
         flash("Capa da sua coleção atualizada.", "success")
         target_id = album_id
 
     return redirect(request.referrer or url_for("main.album_detail", album_id=target_id))
 
 
+@main_bp.route("/images/<int:size>/<path:filename>")
+def image_variant(size, filename):
+    """Build a missing derivative (see ``storage.image_url``) and serve it."""
+    if size not in THUMBNAIL_SIZES or not is_upload(filename):
+        abort(404)
+    variant = ensure_variant(filename, size)
+    if variant is None:
+        # Pillow missing or the upload cannot be decoded: serve it as stored.
+        return redirect(url_for("static", filename=filename))
+    return send_from_directory(
+        current_app.static_folder, variant, max_age=IMAGE_VARIANT_MAX_AGE
+    )
+
+
 @main_bp.route("/reviews/<int:review_id>/comments", methods=["POST"])
 @login_required
 def add_comment(review_id):
@@ -724,8 +875,15 @@ def edit_review(review_id):
         elif len(content) > 4000:
             flash("A review pode ter no máximo 4000 caracteres.", "error")
         else:
+            previous_rating = review.rating
             review.rating = rating_value
             review.content = content
+            db.session.flush()
+            apply_review_changes(
+                master_for_album(review.album).id,
+                added=[rating_value],
+                removed=[previous_rating],
+            )
             db.session.commit()
             flash("Review atualizada.", "success")
             return redirect(url_for("main.album_detail", album_id=review.album_id))
@@ -734,6 +892,7 @@ def edit_review(review_id):
 
 
 @main_bp.route("/reviews/<int:review_id>")
+@replica_reads
 @login_required
 def view_review(review_id):
     review = (
@@ -744,9 +903,10 @@ def view_review(review_id):
         )
         .get_or_404(review_id)
     )
-    review_reaction_counts, review_user_reactions = _review_reaction_maps([review.id])
-    comment_ids = [comment.id for comment in review.comments]
-    comment_reaction_counts, comment_user_reactions = _comment_reaction_maps(comment_ids)
+    review_reaction_counts, review_user_reactions = _review_reaction_maps([review])
+    comment_reaction_counts, comment_user_reactions = _comment_reaction_maps(
+        review.comments
+    )
     return render_template(
         "review_view.html",
         review=review,
@@ -791,9 +951,11 @@ def react_review(review_id):
     reaction = ReviewReaction.query.filter_by(
         review_id=review.id, user_id=current_user.id
     ).first()
+    previous = reaction.value if reaction else None
 
     if reaction and reaction.value == value:
         db.session.delete(reaction)
+        current = None
     else:
         if reaction:
             reaction.value = value
@@ -804,16 +966,20 @@ def react_review(review_id):
                 value=value,
             )
             db.session.add(reaction)
+        current = value
 
+    db.session.flush()
+    likes, dislikes = apply_reaction_deltas(
+        Review, review.id, *reaction_deltas(previous, current)
+    )
     db.session.commit()
     if _wants_json_response():
-        counts, user_map = _review_reaction_maps([review.id])
         payload = {
             "target_type": "review",
-            "target_id": review.id,
-            "likes": counts.get(review.id, {}).get("likes", 0),
-            "dislikes": counts.get(review.id, {}).get("dislikes", 0),
-            "user_reaction": user_map.get(review.id),
+            "target_id": review_id,
+            "likes": likes,
+            "dislikes": dislikes,
+            "user_reaction": current,
         }
         return jsonify(payload)
     return redirect(request.referrer or url_for("main.feed"))
@@ -837,9 +1003,11 @@ def react_comment(review_id, comment_id):
     reaction = CommentReaction.query.filter_by(
         comment_id=comment.id, user_id=current_user.id
     ).first()
+    previous = reaction.value if reaction else None
 
     if reaction and reaction.value == value:
         db.session.delete(reaction)
+        current = None
     else:
         if reaction:
             reaction.value = value
@@ -850,16 +1018,20 @@ def react_comment(review_id, comment_id):
                 value=value,
             )
             db.session.add(reaction)
+        current = value
 
+    db.session.flush()
+    likes, dislikes = apply_reaction_deltas(
+        ReviewComment, comment.id, *reaction_deltas(previous, current)
+    )
     db.session.commit()
     if _wants_json_response():
-        counts, user_map = _comment_reaction_maps([comment.id])
         payload = {
             "target_type": "comment",
-            "target_id": comment.id,
-            "likes": counts.get(comment.id, {}).get("likes", 0),
-            "dislikes": counts.get(comment.id, {}).get("dislikes", 0),
-            "user_reaction": user_map.get(comment.id),
+            "target_id": comment_id,
+            "likes": likes,
+            "dislikes": dislikes,
+            "user_reaction": current,
         }
         return jsonify(payload)
     return redirect(request.referrer or url_for("main.feed"))
@@ -873,7 +1045,11 @@ def delete_review(review_id):
         abort(403)
 
     album_id = review.album_id
+    master_id = master_for_album(review.album).id
+    rating = review.rating
     db.session.delete(review)
+    db.session.flush()
+    apply_review_changes(master_id, removed=[rating])
     db.session.commit()
     flash("Review removida.", "success")
     redirect_to = request.form.get("redirect_to")
@@ -898,26 +1074,18 @@ def chat():
             flash("Usuário não encontrado.", "error")
             return redirect(url_for("main.chat"))
 
-        allowed_ids = {
-            user.id for user in chain(current_user.following, current_user.followers)
-        }
-        if recipient.id not in allowed_ids and recipient.id != current_user.id:
+        if not _can_message(recipient):
             flash("Você só pode enviar mensagens para seguidores ou seguidos.", "error")
             return redirect(url_for("main.chat"))
 
-        message = Message(
-            sender_id=current_user.id,
-            receiver_id=recipient.id,
-            content=content,
-        )
-        db.session.add(message)
-        db.session.commit()
+        _send_message(recipient, content)
         flash("Mensagem enviada.", "success")
         return redirect(url_for("main.chat", with_user=recipient.id))
 
     raw_recipient = request.args.get("with_user")
     selected_user = None
     conversation = []
+    has_more_history = False
 
     if raw_recipient:
         try:
@@ -927,69 +1095,60 @@ def chat():
         if recipient_id:
             selected_user = User.query.filter_by(id=recipient_id).first()
         if selected_user:
-            conversation = (
-                Message.query.filter(
-                    or_(
-                        and_(
-                            Message.sender_id == current_user.id,
-                            Message.receiver_id == selected_user.id,
-                        ),
-                        and_(
-                            Message.sender_id == selected_user.id,
-                            Message.receiver_id == current_user.id,
-                        ),
-                    )
-                )
-                .order_by(Message.created_at.asc())
-                .all()
+            conversation, has_more_history = _chat_history_page(
+                current_user.id, selected_user.id
             )
-            if conversation:
-                last_incoming = [
-                    (message.id, message.created_at)
-                    for message in conversation
+            last_incoming = next(
+                (
+                    message
+                    for message in reversed(conversation)
                     if message.sender_id == selected_user.id
-                ]
-                if last_incoming:
-                    last_incoming_id, last_incoming_at = max(
-                        last_incoming, key=lambda item: item[1]
-                    )
-                    _mark_messages_as_read(
-                        current_user.id,
-                        selected_user.id,
-                        last_incoming_id,
-                        last_incoming_at,
+                ),
+                None,
+            )
+            if last_incoming is None and has_more_history:
+                # Only our own messages on this page; theirs are further back.
+                last_incoming = (
+                    Message.query.filter_by(
+                        sender_id=selected_user.id, receiver_id=current_user.id
                     )
+                    .order_by(Message.id.desc())
+                    .first()
+                )
+            if last_incoming is not None:
+                _mark_messages_as_read(
+                    current_user.id,
+                    selected_user.id,
+                    last_incoming.id,
+                    last_incoming.created_at,
+                )
 
-    contacts_map = {}
-    for user in chain(current_user.following, current_user.followers):
-        contacts_map[user.id] = user
-    contact_ids = list(contacts_map.keys())
-
+    contacts = []
     last_activity = {}
-    if contact_ids:
-        other_id = case(
-            (Message.sender_id == current_user.id, Message.receiver_id),
-            else_=Message.sender_id,
-        )
-        last_rows = (
-            db.session.query(other_id.label("contact_id"), func.max(Message.created_at))
-            .filter(
-                or_(
-                    Message.sender_id == current_user.id,
-                    Message.receiver_id == current_user.id,
-                ),
-                or_(
-                    Message.sender_id.in_(contact_ids),
-                    Message.receiver_id.in_(contact_ids),
+    unread_counts = {}
+    chat_contact_ids = contact_ids(current_user.id)
+    if chat_contact_ids:
+        rows = (
+            db.session.query(
+                User, Conversation.last_message_at, Conversation.unread_count
+            )
+            .outerjoin(
+                Conversation,
+                and_(
+                    Conversation.user_id == current_user.id,
+                    Conversation.contact_id == User.id,
                 ),
             )
-            .group_by("contact_id")
+            .filter(User.id.in_(chat_contact_ids))
             .all()
         )
-        last_activity = {row.contact_id: row[1] for row in last_rows}
-
-    contacts = sorted(
-        contacts_map.values(),
+        for user, last_message_at, unread_count in rows:
+            contacts.append(user)
+            if last_message_at:
+                last_activity[user.id] = last_message_at
+            if unread_count:
+                unread_counts[user.id] = unread_count
+    contacts.sort(
         key=lambda u: (
             last_activity.get(u.id) or datetime.min,
             u.username.lower(),
@@ -1002,12 +1161,57 @@ def chat():
         contacts=contacts,
         selected_user=selected_user,
         conversation=conversation,
-        unread_counts=_get_unread_counts(current_user.id, {user.id for user in contacts}),
+        has_more_history=has_more_history,
+        unread_counts=unread_counts,
         contact_last_activity=last_activity,
         page_class="chat-page",
     )
 
 
+def _message_event(message: Message) -> dict:
+    return {
+        "kind": "message",
+        "id": message.id,
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "content": message.content,
+        "created_at": _to_utc_iso(message.created_at),
+    }
+
+
+def _publish_message(message: Message) -> None:
+    """Wake both participants' waiters once ``message`` is committed."""
+    data = _message_event(message)
+    for user_id in {message.sender_id, message.receiver_id}:
+        publish_on_commit(user_topic(user_id), data)
+
+
+def _can_message(recipient: User) -> bool:
+    return recipient.id in contact_ids(current_user.id) or recipient.id == current_user.id
+
+
+def _send_message(recipient: User, content: str) -> Message:
+    """Store a message from the current user; both sides are woken on commit."""
+    message = Message(
+        sender_id=current_user.id,
+        receiver_id=recipient.id,
+        content=content,
+    )
+    db.session.add(message)
+    db.session.flush()
+    record_message(message)
+    _publish_message(message)
+    db.session.commit()
+    return message
+
+
+def _updates_subscription(enabled: bool):
+    """Subscribe to the current user's events, or a no-op when not waiting."""
+    if not enabled:
+        return nullcontext()
+    return current_bus().subscribe(user_topic(current_user.id))
+
+
 def _mark_messages_as_read(
     user_id: int,
     contact_id: int,
@@ -1026,9 +1230,12 @@ def _mark_messages_as_read(
         db.session.add(state)
     if state.last_read_message_id is None:
         state.last_read_message_id = 0
+    read_event = {"kind": "read", "contact_id": contact_id}
     if last_message_id <= state.last_read_message_id:
         if not state.last_read_at and last_message_at:
             state.last_read_at = last_message_at
+            _set_unread(user_id, contact_id, last_message_at)
+            publish_on_commit(user_topic(user_id), read_event)
             db.session.commit()
         return
     state.last_read_message_id = last_message_id
@@ -1037,121 +1244,138 @@ def _mark_messages_as_read(
         last_message_at = message.created_at if message else None
     if last_message_at:
         state.last_read_at = last_message_at
+    # Usually zero; anything newer than what the client saw stays unread.
+    _set_unread(user_id, contact_id, state.last_read_at)
+    publish_on_commit(user_topic(user_id), read_event)
     db.session.commit()
 
 
-def _get_unread_counts(user_id: int, sender_ids: set[int] | None = None) -> dict[int, int]:
-    if sender_ids is not None and not sender_ids:
-        return {}
-    state_alias = aliased(ChatReadState)
-    epoch = datetime(1970, 1, 1)
-    query = (
-        db.session.query(
-            Message.sender_id.label("sender_id"),
-            func.count(Message.id).label("unread_count"),
-        )
-        .outerjoin(
-            state_alias,
-            and_(
-                state_alias.user_id == user_id,
-                state_alias.contact_id == Message.sender_id,
-            ),
-        )
-        .filter(Message.receiver_id == user_id)
-        .filter(
-            or_(
-                state_alias.last_read_at.is_(None),
-                Message.created_at > func.coalesce(state_alias.last_read_at, epoch),
-            )
-        )
+def _set_unread(user_id: int, contact_id: int, read_at: datetime | None) -> None:
+    """Recount the conversation's unread messages newer than ``read_at``.
+
+    The row is locked before counting, so a concurrent ``record_message``
+    either commits first (and is counted) or waits and adds on top.
+    """
+    conversation = Conversation.query.filter_by(user_id=user_id, contact_id=contact_id)
+    if conversation.with_entities(Conversation.user_id).with_for_update().first() is None:
+        return
+    conversation.update(
+        {"unread_count": count_unread(user_id, contact_id, read_at)},
+        synchronize_session=False,
     )
-    if sender_ids is not None:
-        query = query.filter(Message.sender_id.in_(sender_ids))
-    unread_rows = query.group_by(Message.sender_id).all()
-    return {row.sender_id: int(row.unread_count) for row in unread_rows}
 
 
-def _collect_notifications(user: User, since: datetime | None):
-    follow_query = Follow.query.filter(Follow.following_id == user.id)
+def _collect_notifications(
+    user: User,
+    since: datetime | None,
+    followers_limit: int = NOTIFICATIONS_LIMIT,
+    messages_limit: int = NOTIFICATIONS_LIMIT,
+):
+    """Newest followers and latest message per sender, each capped, plus the
+    unread total. Every query is a bounded index range on ``user``."""
+    follow_query = (
+        db.session.query(Follow.created_at, User)
+        .join(User, User.id == Follow.follower_id)
+        .filter(Follow.following_id == user.id)
+    )
     if since:
         follow_query = follow_query.filter(Follow.created_at > since)
-    follow_records = follow_query.order_by(Follow.created_at.desc()).all()
-
-    follower_ids = {record.follower_id for record in follow_records}
-    followers_map = (
-        {
-            follower.id: follower
-            for follower in User.query.filter(User.id.in_(follower_ids)).all()
-        }
-        if follower_ids
-        else {}
+    follow_rows = (
+        follow_query.order_by(Follow.created_at.desc()).limit(followers_limit).all()
     )
-
     followers_payload = [
         {
-            "id": record.follower_id,
-            "username": followers_map[record.follower_id].username,
-            "avatar_url": followers_map[record.follower_id].avatar_url,
-            "created_at": _to_utc_iso(record.created_at),
+            "id": follower.id,
+            "username": follower.username,
+            "avatar_url": follower.avatar_url,
+            "created_at": _to_utc_iso(followed_at),
         }
-        for record in follow_records
-        if record.follower_id in followers_map
+        for followed_at, follower in follow_rows
     ]
 
-    unread_counts_all = _get_unread_counts(user.id)
-    total_unread = sum(unread_counts_all.values())
+    total_unread = (
+        db.session.query(func.coalesce(func.sum(Conversation.unread_count), 0))
+        .filter(Conversation.user_id == user.id)
+        .scalar()
+    )
 
-    message_query = Message.query.filter(Message.receiver_id == user.id)
+    # Latest message received from each contact: one row per conversation.
+    latest_query = (
+        db.session.query(Message, User, Conversation.unread_count)
+        .join(Conversation, Conversation.last_incoming_message_id == Message.id)
+        .join(User, User.id == Message.sender_id)
+        .filter(Conversation.user_id == user.id)
+    )
     if since:
-        message_query = message_query.filter(Message.created_at > since)
-    message_records = message_query.order_by(Message.created_at.desc()).all()
+        latest_query = latest_query.filter(Conversation.last_incoming_at > since)
+    latest_rows = (
+        latest_query.order_by(Conversation.last_incoming_at.desc())
+        .limit(messages_limit)
+        .all()
+    )
 
-    senders = {message.sender_id for message in message_records}
-    senders_map = (
+    messages_payload = [
         {
-            sender.id: sender
-            for sender in User.query.filter(User.id.in_(senders)).all()
+            "from_user": {
+                "id": sender.id,
+                "username": sender.username,
+                "avatar_url": sender.avatar_url,
+            },
+            "latest_message": message.content,
+            "created_at": _to_utc_iso(message.created_at),
+            "unread_count": unread_count,
         }
-        if senders
-        else {}
-    )
+        for message, sender, unread_count in latest_rows
+    ]
 
-    latest_per_sender: dict[int, dict[str, object]] = {}
-    for message in message_records:
-        sender = senders_map.get(message.sender_id)
-        if not sender:
-            continue
-        existing = latest_per_sender.get(sender.id)
-        if not existing or message.created_at > existing["created_at"]:
-            latest_per_sender[sender.id] = {
-                "created_at": message.created_at,
-                "from_user": {
-                    "id": sender.id,
-                    "username": sender.username,
-                    "avatar_url": sender.avatar_url,
-                },
-                "latest_message": message.content,
-            }
+    return followers_payload, messages_payload, int(total_unread)
 
-    messages_payload = []
-    for _, entry in sorted(
-        (
-            (value["created_at"], value)
-            for value in latest_per_sender.values()
-        ),
-        key=lambda pair: pair[0],
-        reverse=True,
-    ):
-        messages_payload.append(
-            {
-                "from_user": entry["from_user"],
-                "latest_message": entry["latest_message"],
-                "created_at": _to_utc_iso(entry["created_at"]),
-                "unread_count": unread_counts_all.get(entry["from_user"]["id"], 0),
-            }
-        )
 
-    return followers_payload, messages_payload, total_unread
+def _notifications_limit(name: str) -> int:
+    limit_param = request.args.get(name, type=int)
+    limit = limit_param if limit_param else NOTIFICATIONS_LIMIT
+    return max(1, min(limit, NOTIFICATIONS_MAX_LIMIT))
+
+
+def _poll_timeout() -> int:
+    timeout_param = request.args.get("timeout", type=int)
+    return max(5, min(timeout_param if timeout_param else 30, 60))
+
+
+def _notifications_snapshot(
+    since: datetime | None, known_unread: int | None
+) -> tuple[dict, bool]:
+    """One notifications round: the JSON payload and whether it is news."""
+    (
+        followers_payload,
+        messages_payload,
+        total_unread_messages,
+    ) = _collect_notifications(
+        current_user,
+        since,
+        _notifications_limit("followers_limit"),
+        _notifications_limit("messages_limit"),
+    )
+    unread_changed = (
+        known_unread is not None and known_unread != total_unread_messages
+    )
+    payload = {
+        "server_time": _to_utc_iso(datetime.now(timezone.utc)),
+        "new_followers": followers_payload,
+        "new_messages": messages_payload,
+        "total_unread_messages": total_unread_messages,
+    }
+    return payload, bool(followers_payload or messages_payload or unread_changed)
+
+
+def _quiet_notifications(payload: dict) -> dict:
+    """``payload`` without news, answered when a wait times out."""
+    return dict(
+        payload,
+        server_time=_to_utc_iso(datetime.now(timezone.utc)),
+        new_followers=[],
+        new_messages=[],
+    )
 
 
 @main_bp.route("/api/notifications")
@@ -1159,45 +1383,29 @@ def _collect_notifications(user: User, since: datetime | None):
 def notifications_api():
     since = _parse_iso(request.args.get("since"))
     wait_for_updates = bool(request.args.get("wait", type=int))
-    timeout_param = request.args.get("timeout", type=int)
-    timeout_seconds = max(5, min(timeout_param if timeout_param else 30, 60))
-    deadline = time.monotonic() + timeout_seconds if wait_for_updates else None
+    deadline = time.monotonic() + _poll_timeout() if wait_for_updates else None
     known_unread = request.args.get("unread_snapshot", type=int)
 
-    while True:
-        (
-            followers_payload,
-            messages_payload,
-            total_unread_messages,
-        ) = _collect_notifications(
-            current_user, since
-        )
-        unread_changed = (
-            known_unread is not None and known_unread != total_unread_messages
-        )
-        if (
-            not wait_for_updates
-            or followers_payload
-            or messages_payload
-            or unread_changed
-            or (deadline is not None and time.monotonic() >= deadline)
-        ):
-            return jsonify(
-                {
-                    "server_time": _to_utc_iso(datetime.now(timezone.utc)),
-                    "new_followers": followers_payload,
-                    "new_messages": messages_payload,
-                    "total_unread_messages": total_unread_messages,
-                }
-            )
-        time.sleep(1)
-        db.session.expire_all()
-
-
-def _load_chat_messages(
-    current_id: int, target_id: int, after_id: int | None
-) -> list[Message]:
-    conversation_query = Message.query.filter(
+    # Subscribe before the first query so nothing committed in between is missed.
+    with _updates_subscription(wait_for_updates) as subscription:
+        while True:
+            payload, has_news = _notifications_snapshot(since, known_unread)
+            if (
+                not wait_for_updates
+                or has_news
+                or time.monotonic() >= deadline
+            ):
+                return jsonify(payload)
+            # Hand the connection back to the pool while idle; the next round
+            # starts a new transaction with fresh data.
+            db.session.close()
+            if not subscription.wait(deadline - time.monotonic()):
+                # Nothing happened for this user: answer without another query.
+                return jsonify(_quiet_notifications(payload))
+
+
+def _conversation_query(current_id: int, target_id: int):
+    return Message.query.filter(
         or_(
             and_(
                 Message.sender_id == current_id,
@@ -1209,75 +1417,112 @@ def _load_chat_messages(
             ),
         )
     )
-    if after_id is not None:
-        conversation_query = conversation_query.filter(Message.id > after_id)
 
-    return conversation_query.order_by(Message.created_at.asc()).all()
 
+def _load_chat_messages(current_id: int, target_id: int, after_id: int) -> list[Message]:
+    return (
+        _conversation_query(current_id, target_id)
+        .filter(Message.id > after_id)
+        .order_by(Message.created_at.asc())
+        .all()
+    )
+
+
+def _chat_history_page(
+    current_id: int, target_id: int, before_id: int | None = None
+) -> tuple[list[Message], bool]:
+    """The latest ``CHAT_PAGE_SIZE`` messages below ``before_id``, oldest first,
+    and whether older ones exist."""
+    query = _conversation_query(current_id, target_id)
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    rows = query.order_by(Message.id.desc()).limit(CHAT_PAGE_SIZE + 1).all()
+    return rows[:CHAT_PAGE_SIZE][::-1], len(rows) > CHAT_PAGE_SIZE
 
-@main_bp.route("/api/chat/<int:user_id>/messages")
-@login_required
-def chat_messages_api(user_id: int):
+
+def _chat_target(user_id: int) -> User:
     target = User.query.get_or_404(user_id)
-    allowed_ids = {
-        user.id for user in chain(current_user.following, current_user.followers)
-    }
-    if target.id not in allowed_ids and target.id != current_user.id:
+    if not _can_message(target):
         abort(403)
+    return target
 
-    after_id = request.args.get("after", type=int)
-    is_active = bool(request.args.get("active", type=int))
-    wait_for_updates = bool(request.args.get("wait", type=int)) and (
-        after_id is not None
-    )
-    timeout_param = request.args.get("timeout", type=int)
-    timeout_seconds = max(5, min(timeout_param if timeout_param else 30, 60))
-    deadline = time.monotonic() + timeout_seconds if wait_for_updates else None
 
-    while True:
+def _chat_message_payload(message: Message) -> dict:
+    return {
+        "id": message.id,
+        "from_me": message.sender_id == current_user.id,
+        "content": message.content,
+        "created_at": _to_utc_iso(message.created_at),
+    }
+
+
+def _chat_snapshot(target: User, after_id: int | None) -> tuple[dict, bool]:
+    """Messages after ``after_id`` (the latest page without one): the JSON
+    payload and whether any arrived."""
+    if after_id is None:
+        messages, _ = _chat_history_page(current_user.id, target.id)
+    else:
         messages = _load_chat_messages(current_user.id, target.id, after_id)
+    if not messages:
+        return {"messages": [], "last_id": after_id or 0}, False
+    payload = [_chat_message_payload(message) for message in messages]
+    return {"messages": payload, "last_id": payload[-1]["id"]}, True
+
+
+def _messages_after(user_id: int, after_id: int, limit: int) -> list[Message]:
+    """Messages sent or received by ``user_id`` with an id above ``after_id``."""
+    return (
+        Message.query.filter(
+            or_(Message.sender_id == user_id, Message.receiver_id == user_id),
+            Message.id > after_id,
+        )
+        .order_by(Message.id.asc())
+        .limit(limit)
+        .all()
+    )
 
-        if messages:
-            payload = [
-                {
-                    "id": message.id,
-                    "from_me": message.sender_id == current_user.id,
-                    "content": message.content,
-                    "created_at": _to_utc_iso(message.created_at),
-                }
-                for message in messages
-            ]
-            last_incoming = [
-                (message.id, message.created_at)
-                for message in messages
-                if message.sender_id == target.id
-            ]
-            return jsonify(
-                {
-                    "messages": payload,
-                    "last_id": payload[-1]["id"],
-                }
-            )
 
-        if (
-            not wait_for_updates
-            or (deadline is not None and time.monotonic() >= deadline)
-        ):
-            return jsonify({"messages": [], "last_id": after_id or 0})
+@main_bp.route("/api/chat/<int:user_id>/messages")
+@replica_reads
+@login_required
+def chat_messages_api(user_id: int):
+    target = _chat_target(user_id)
+
+    before_id = request.args.get("before", type=int)
+    if before_id is not None:
+        messages, has_more = _chat_history_page(current_user.id, target.id, before_id)
+        return jsonify(
+            {
+                "messages": [_chat_message_payload(message) for message in messages],
+                "has_more": has_more,
+            }
+        )
 
-        time.sleep(1)
-        db.session.expire_all()
+    after_id = request.args.get("after", type=int)
+    wait_for_updates = bool(request.args.get("wait", type=int)) and (
+        after_id is not None
+    )
+    deadline = time.monotonic() + _poll_timeout() if wait_for_updates else None
+
+    with _updates_subscription(wait_for_updates) as subscription:
+        while True:
+            payload, has_messages = _chat_snapshot(target, after_id)
+            if (
+                not wait_for_updates
+                or has_messages
+                or time.monotonic() >= deadline
+            ):
+                return jsonify(payload)
+            db.session.close()
+            if not subscription.wait(deadline - time.monotonic()):
+                return jsonify(payload)
+            use_primary()
 
 
 @main_bp.route("/api/chat/<int:user_id>/read", methods=["POST"])
 @login_required
 def chat_mark_read_api(user_id: int):
-    target = User.query.get_or_404(user_id)
-    allowed_ids = {
-        user.id for user in chain(current_user.following, current_user.followers)
-    }
-    if target.id not in allowed_ids and target.id != current_user.id:
-        abort(403)
+    target = _chat_target(user_id)
 
     data = request.get_json(silent=True) or {}
     last_id = data.get("last_message_id")
@@ -1313,6 +1558,7 @@ def chat_mark_read_api(user_id: int):
 
 
 @main_bp.route("/search")
+@replica_reads
 @login_required
 def search():
     query = request.args.get("q", "").strip()
@@ -1321,46 +1567,29 @@ def search():
     album_results = []
 
     if query:
-        like_term = f"%{query.lower()}%"
         if filter_type in ("all", "users"):
-            user_results = (
-                User.query.filter(User.id != current_user.id)
-                .filter(
-                    or_(
-                        func.lower(User.username).like(like_term),
-                        func.lower(User.bio).like(like_term),
-                    )
-                )
-                .order_by(User.username.asc())
-                .limit(20)
-                .all()
-            )
+            user_results = search_users(query, limit=20, exclude_id=current_user.id)
         if filter_type in ("all", "albums"):
-            album_results = (
-                Album.query.join(User, Album.user_id == User.id)
-                .filter(
-                    or_(
-                        func.lower(Album.title).like(like_term),
-                        func.lower(Album.artist).like(like_term),
-                    )
-                )
-                .order_by(Album.created_at.asc())
-                .limit(40)
-                .all()
+            masters = search_album_masters(query, limit=20)
+            representatives = _representative_album_ids([master.id for master in masters])
+            albums_by_id = (
+                {
+                    album.id: album
+                    for album in Album.query.options(joinedload(Album.owner))
+                    .filter(Album.id.in_(list(representatives.values())))
+                    .all()
+                }
+                if representatives
+                else {}
             )
-            unique_albums = []
-            seen_keys = set()
-            for album in album_results:
-                key = (album.title.lower(), album.artist.lower())
-                if key in seen_keys:
-                    continue
-                unique_albums.append(album)
-                seen_keys.add(key)
-            album_results = unique_albums
-
-    owned_signatures = {
-        (album.title.lower(), album.artist.lower()) for album in current_user.albums
-    }
+            # Keep the relevance order of the masters.
+            album_results = [
+                albums_by_id[representatives[master.id]]
+                for master in masters
+                if master.id in representatives
+            ]
+
+    owned_master_ids = owned_albums.get(current_user.id)
 
     return render_template(
         "search.html",
@@ -1368,5 +1597,5 @@ def search():
         filter_type=filter_type,
         user_results=user_results,
         album_results=album_results,
-        owned_signatures=owned_signatures,
+        owned_master_ids=owned_master_ids,
     )
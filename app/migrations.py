@@ -0,0 +1,322 @@
+"""Versioned, online-friendly schema migrations.
+
+Every migration has a version number; the highest applied one is recorded in
+the ``schema_version`` table, so ``migrate()`` only runs what is pending.
+Steps are written to be safe on large live tables:
+
+* :class:`SQL` runs short DDL in its own transaction with a ``lock_timeout``,
+  so an ``ALTER TABLE`` gives up instead of queueing every query behind it;
+* :class:`ConcurrentIndex` uses ``CREATE INDEX CONCURRENTLY`` (outside any
+  transaction) and drops an invalid leftover from an interrupted build first;
+* :class:`Backfill` updates rows in bounded key ranges, committing each batch
+  and reporting progress;
+* :class:`Call` runs a Python helper (which commits on its own).
+
+Steps must be idempotent: a migration interrupted halfway is simply run again.
+The DDL is PostgreSQL's; on other databases (SQLite in development) only the
+Python steps run, since ``db.create_all()`` in the baseline already builds the
+current schema there.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+
+from . import db
+from .catalog import (
+    album_stats_values,
+    cluster_album_masters,
+    insert_missing_album_stats,
+)
+from .counters import (
+    insert_missing_conversations,
+    last_incoming_values,
+    reaction_counter_values,
+    unread_counter_values,
+)
+from .models import AlbumStats, Conversation, Review, ReviewComment
+
+LOCK_TIMEOUT = "5s"
+# Migrations are exempt from DB_STATEMENT_TIMEOUT_MS.
+NO_STATEMENT_TIMEOUT = "SET LOCAL statement_timeout = 0"
+BACKFILL_BATCH_SIZE = 5000
+
+_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _is_postgres() -> bool:
+    return db.engine.dialect.name == "postgresql"
+
+
+class SQL:
+    def __init__(self, statement: str) -> None:
+        self.statement = statement
+
+    def apply(self, report) -> None:
+        if not _is_postgres():
+            return
+        db.session.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        db.session.execute(text(NO_STATEMENT_TIMEOUT))
+        db.session.execute(text(self.statement))
+        db.session.commit()
+
+
+class ConcurrentIndex:
+    def __init__(self, name: str, definition: str) -> None:
+        self.name = name
+        self.definition = definition
+
+    def apply(self, report) -> None:
+        if not _is_postgres():
+            return
+        db.session.commit()
+        report(f"   índice {self.name} (CONCURRENTLY)")
+        engine = db.engine.execution_options(isolation_level="AUTOCOMMIT")
+        with engine.connect() as connection:
+            connection.execute(text("SET statement_timeout = 0"))
+            try:
+                self._build(connection)
+            finally:
+                connection.execute(text("RESET statement_timeout"))
+
+    def _build(self, connection) -> None:
+        valid = connection.execute(
+            text(
+                "SELECT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+            ),
+            {"name": self.name},
+        ).scalar()
+        if valid is False:
+            # Left behind by an interrupted concurrent build.
+            connection.execute(text(f"DROP INDEX CONCURRENTLY {self.name}"))
+        connection.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.name} "
+                f"{self.definition}"
+            )
+        )
+
+
+class Backfill:
+    def __init__(self, description: str, model, values, key=None, batch_size=None) -> None:
+        self.description = description
+        self.model = model
+        # Callable returning the UPDATE values, built fresh for every batch.
+        self.values = values
+        self.key = key if key is not None else model.id
+        self.batch_size = batch_size or BACKFILL_BATCH_SIZE
+
+    def apply(self, report) -> None:
+        first, last = db.session.query(func.min(self.key), func.max(self.key)).one()
+        if first is None:
+            return
+        total = last - first + 1
+        reported = -1
+        start = first
+        while start <= last:
+            end = start + self.batch_size
+            if _is_postgres():
+                db.session.execute(text(NO_STATEMENT_TIMEOUT))
+            db.session.execute(
+                update(self.model)
+                .where(self.key >= start, self.key < end)
+                .values(**self.values())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            percent = min(100, (end - first) * 100 // total)
+            if percent // 10 != reported // 10:
+                report(f"   {self.description}: {percent}%")
+                reported = percent
+            start = end
+
+
+class Call:
+    def __init__(self, function) -> None:
+        self.function = function
+
+    def apply(self, report) -> None:
+        self.function()
+        db.session.commit()
+
+
+class Migration:
+    def __init__(self, version: int, name: str, *steps) -> None:
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+
+MIGRATIONS = (
+    Migration(
+        1,
+        "baseline",
+        # Creates whatever tables are missing (all of them on a new database).
+        Call(db.create_all),
+        SQL(
+            "ALTER TABLE users "
+            "ADD COLUMN IF NOT EXISTS is_admin BOOLEAN NOT NULL DEFAULT FALSE"
+        ),
+        SQL(
+            "ALTER TABLE albums ADD COLUMN IF NOT EXISTS "
+            "personal_cover_url VARCHAR(512) NOT NULL DEFAULT ''"
+        ),
+        SQL(
+            "ALTER TABLE chat_read_states "
+            "ADD COLUMN IF NOT EXISTS last_read_at TIMESTAMP NULL"
+        ),
+    ),
+    Migration(
+        2,
+        "reaction_counters",
+        SQL(
+            "ALTER TABLE reviews "
+            "ADD COLUMN IF NOT EXISTS likes INTEGER NOT NULL DEFAULT 0, "
+            "ADD COLUMN IF NOT EXISTS dislikes INTEGER NOT NULL DEFAULT 0"
+        ),
+        SQL(
+            "ALTER TABLE review_comments "
+            "ADD COLUMN IF NOT EXISTS likes INTEGER NOT NULL DEFAULT 0, "
+            "ADD COLUMN IF NOT EXISTS dislikes INTEGER NOT NULL DEFAULT 0"
+        ),
+        Backfill("reviews.likes/dislikes", Review, lambda: reaction_counter_values(Review)),
+        Backfill(
+            "review_comments.likes/dislikes",
+            ReviewComment,
+            lambda: reaction_counter_values(ReviewComment),
+        ),
+    ),
+    Migration(
+        3,
+        "album_masters",
+        SQL(
+            "ALTER TABLE albums ADD COLUMN IF NOT EXISTS "
+            "master_id INTEGER NULL REFERENCES album_masters (id)"
+        ),
+        ConcurrentIndex("ix_albums_master_id", "ON albums (master_id)"),
+        Call(cluster_album_masters),
+        Call(insert_missing_album_stats),
+        Backfill(
+            "album_stats",
+            AlbumStats,
+            album_stats_values,
+            key=AlbumStats.master_id,
+            batch_size=500,
+        ),
+    ),
+    Migration(
+        4,
+        "trigram_search",
+        # Backs the substring/similarity search in app/search.py.
+        SQL("CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+        ConcurrentIndex(
+            "ix_album_masters_title_trgm",
+            "ON album_masters USING gin (title_key gin_trgm_ops)",
+        ),
+        ConcurrentIndex(
+            "ix_album_masters_artist_trgm",
+            "ON album_masters USING gin (artist_key gin_trgm_ops)",
+        ),
+        ConcurrentIndex(
+            "ix_users_username_trgm", "ON users USING gin (lower(username) gin_trgm_ops)"
+        ),
+        ConcurrentIndex(
+            "ix_users_bio_trgm", "ON users USING gin (lower(bio) gin_trgm_ops)"
+        ),
+    ),
+    Migration(
+        5,
+        "hot_path_indexes",
+        # See scripts/explain_queries.py.
+        ConcurrentIndex(
+            "ix_messages_sender_receiver_created",
+            "ON messages (sender_id, receiver_id, created_at)",
+        ),
+        ConcurrentIndex(
+            "ix_messages_receiver_created", "ON messages (receiver_id, created_at)"
+        ),
+        ConcurrentIndex("ix_reviews_user_created", "ON reviews (user_id, created_at)"),
+        ConcurrentIndex("ix_reviews_album_created", "ON reviews (album_id, created_at)"),
+        ConcurrentIndex(
+            "ix_follows_following_created", "ON follows (following_id, created_at)"
+        ),
+        ConcurrentIndex("ix_albums_user_created", "ON albums (user_id, created_at)"),
+        ConcurrentIndex(
+            "ix_review_comments_review_created",
+            "ON review_comments (review_id, created_at)",
+        ),
+    ),
+    Migration(
+        6,
+        "conversations",
+        # Creates the conversations table.
+        Call(db.create_all),
+        Call(insert_missing_conversations),
+        Backfill(
+            "conversations.unread_count/last_incoming",
+            Conversation,
+            lambda: {**unread_counter_values(), **last_incoming_values()},
+            key=Conversation.user_id,
+            batch_size=500,
+        ),
+    ),
+    Migration(
+        7,
+        "bounded_notifications",
+        ConcurrentIndex(
+            "ix_conversations_user_last_incoming",
+            "ON conversations (user_id, last_incoming_at)",
+        ),
+    ),
+)
+
+
+def current_version() -> int:
+    if not inspect(db.engine).has_table(schema_version.name):
+        return 0
+    return db.session.scalar(select(func.max(schema_version.c.version))) or 0
+
+
+def pending_migrations() -> list[Migration]:
+    version = current_version()
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def migrate(report=print) -> int:
+    """Apply pending migrations in order. Returns how many were applied."""
+    _metadata.create_all(db.engine)
+    pending = pending_migrations()
+    for migration in pending:
+        report(f"→ {migration.version:03d} {migration.name}")
+        for step in migration.steps:
+            step.apply(report)
+        db.session.execute(
+            insert(schema_version).values(
+                version=migration.version,
+                name=migration.name,
+                applied_at=datetime.utcnow(),
+            )
+        )
+        db.session.commit()
+    return len(pending)
@@ -3,7 +3,7 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from . import db, login_manager
+from . import db
 
 
 class Follow(db.Model):
@@ -12,6 +12,11 @@ class Follow(db.Model):
     following_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # The primary key covers "who does X follow"; this covers "who follows X".
+    __table_args__ = (
+        db.Index("ix_follows_following_created", "following_id", "created_at"),
+    )
+
 
 class User(UserMixin, db.Model):
     __tablename__ = "users"
@@ -60,7 +65,60 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
     def is_following(self, other: "User") -> bool:
-        return any(following.id == other.id for following in self.following)
+        from .user_cache import following_ids
+
+        return other.id in following_ids(self.id)
+
+
+class AlbumMaster(db.Model):
+    """Canonical album shared by every per-user copy with the same title/artist."""
+
+    __tablename__ = "album_masters"
+
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    artist = db.Column(db.String(200), nullable=False)
+    title_key = db.Column(db.String(200), nullable=False)
+    artist_key = db.Column(db.String(200), nullable=False)
+    cover_url = db.Column(db.String(512), default="", nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    albums = db.relationship("Album", back_populates="master")
+
+    __table_args__ = (
+        db.UniqueConstraint("title_key", "artist_key", name="uq_album_master_signature"),
+    )
+
+
+class AlbumStats(db.Model):
+    """Cached review aggregates for an album master, refreshed on review writes."""
+
+    __tablename__ = "album_stats"
+
+    master_id = db.Column(
+        db.Integer, db.ForeignKey("album_masters.id", ondelete="CASCADE"), primary_key=True
+    )
+    review_count = db.Column(db.Integer, default=0, nullable=False)
+    unique_reviewer_count = db.Column(db.Integer, default=0, nullable=False)
+    rating_sum = db.Column(db.Integer, default=0, nullable=False)
+    rating_1 = db.Column(db.Integer, default=0, nullable=False)
+    rating_2 = db.Column(db.Integer, default=0, nullable=False)
+    rating_3 = db.Column(db.Integer, default=0, nullable=False)
+    rating_4 = db.Column(db.Integer, default=0, nullable=False)
+    rating_5 = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+    @property
+    def avg_rating(self) -> float | None:
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 1)
+
+    @property
+    def histogram(self) -> dict[int, int]:
+        return {value: getattr(self, f"rating_{value}") for value in range(1, 6)}
 
 
 class Album(db.Model):
@@ -68,6 +126,9 @@ class Album(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    master_id = db.Column(
+        db.Integer, db.ForeignKey("album_masters.id"), nullable=True, index=True
+    )
     title = db.Column(db.String(200), nullable=False)
     artist = db.Column(db.String(200), nullable=False)
     cover_url = db.Column(db.String(512), default="", nullable=False)
@@ -75,8 +136,11 @@ class Album(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     owner = db.relationship("User", back_populates="albums")
+    master = db.relationship("AlbumMaster", back_populates="albums")
     reviews = db.relationship("Review", back_populates="album", cascade="all,delete")
 
+    __table_args__ = (db.Index("ix_albums_user_created", "user_id", "created_at"),)
+
 
 class Review(db.Model):
     __tablename__ = "reviews"
@@ -87,6 +151,9 @@ class Review(db.Model):
     rating = db.Column(db.Integer, nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Denormalized from review_reactions; see app/counters.py.
+    likes = db.Column(db.Integer, default=0, nullable=False)
+    dislikes = db.Column(db.Integer, default=0, nullable=False)
 
     user = db.relationship("User", back_populates="reviews")
     album = db.relationship("Album", back_populates="reviews")
@@ -101,6 +168,12 @@ class Review(db.Model):
         back_populates="review",
         cascade="all,delete-orphan",
     )
+    feed_entries = db.relationship(
+        "FeedEntry",
+        back_populates="review",
+        cascade="all,delete-orphan",
+        passive_deletes=True,
+    )
 
     __table_args__ = (
         db.CheckConstraint("rating >= 1 AND rating <= 5", name="check_rating_range"),
@@ -109,6 +182,29 @@ class Review(db.Model):
             "album_id",
             name="uq_review_per_user_album",
         ),
+        db.Index("ix_reviews_user_created", "user_id", "created_at"),
+        db.Index("ix_reviews_album_created", "album_id", "created_at"),
+    )
+
+
+class FeedEntry(db.Model):
+    """Materialized timeline row: ``review_id`` shows up in ``user_id``'s feed."""
+
+    __tablename__ = "feed_entries"
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    review_id = db.Column(
+        db.Integer, db.ForeignKey("reviews.id", ondelete="CASCADE"), primary_key=True
+    )
+    # Copy of Review.created_at so the feed is a single range scan on this table.
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    review = db.relationship("Review", back_populates="feed_entries")
+
+    __table_args__ = (
+        db.Index("ix_feed_entries_user_created", "user_id", "created_at", "review_id"),
     )
 
 
@@ -128,6 +224,18 @@ class Message(db.Model):
         "User", foreign_keys=[receiver_id], back_populates="messages_received"
     )
 
+    __table_args__ = (
+        # Conversations (either direction) and unread counts per contact.
+        db.Index(
+            "ix_messages_sender_receiver_created",
+            "sender_id",
+            "receiver_id",
+            "created_at",
+        ),
+        # Inbox-wide reads: notifications and the per-user message stream.
+        db.Index("ix_messages_receiver_created", "receiver_id", "created_at"),
+    )
+
 
 class ChatReadState(db.Model):
     __tablename__ = "chat_read_states"
@@ -141,6 +249,44 @@ class ChatReadState(db.Model):
     )
 
 
+class Conversation(db.Model):
+    """Chat list summary of user_id's conversation with contact_id.
+
+    Kept current when messages are sent and read; see app/counters.py.
+    """
+
+    __tablename__ = "conversations"
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    contact_id = db.Column(
+        db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    # Latest message in either direction.
+    last_message_id = db.Column(
+        db.Integer, db.ForeignKey("messages.id", ondelete="SET NULL"), nullable=True
+    )
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    # Latest message from contact_id to user_id.
+    last_incoming_message_id = db.Column(
+        db.Integer, db.ForeignKey("messages.id", ondelete="SET NULL"), nullable=True
+    )
+    last_incoming_at = db.Column(db.DateTime, nullable=True)
+    # Messages from contact_id not yet read by user_id.
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+
+    last_message = db.relationship("Message", foreign_keys=[last_message_id])
+    last_incoming_message = db.relationship(
+        "Message", foreign_keys=[last_incoming_message_id]
+    )
+
+    # Latest received messages first: chat notifications.
+    __table_args__ = (
+        db.Index("ix_conversations_user_last_incoming", "user_id", "last_incoming_at"),
+    )
+
+
 class ReviewComment(db.Model):
     __tablename__ = "review_comments"
 
@@ -149,6 +295,9 @@ class ReviewComment(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Denormalized from comment_reactions; see app/counters.py.
+    likes = db.Column(db.Integer, default=0, nullable=False)
+    dislikes = db.Column(db.Integer, default=0, nullable=False)
 
     review = db.relationship("Review", back_populates="comments")
     user = db.relationship("User", back_populates="comments")
@@ -158,6 +307,10 @@ class ReviewComment(db.Model):
         cascade="all,delete-orphan",
     )
 
+    __table_args__ = (
+        db.Index("ix_review_comments_review_created", "review_id", "created_at"),
+    )
+
 
 class ReviewReaction(db.Model):
     __tablename__ = "review_reactions"
@@ -197,8 +350,3 @@ class CommentReaction(db.Model):
     __table_args__ = (
         db.CheckConstraint("value IN (-1, 1)", name="check_comment_reaction_value"),
     )
-
-
-@login_manager.user_loader
-def load_user(user_id: str):
-    return User.query.get(int(user_id))
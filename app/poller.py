@@ -0,0 +1,170 @@
+"""Shared per-process poller feeding the event bus.
+
+With ``EVENT_BUS=local`` a commit only wakes waiters of its own process, so
+a follow or message written by another process would go unnoticed until the
+long-poll times out. Instead of every waiting request querying on its own,
+one thread per process runs a single batched query per tick for every user
+with a waiter here: new follows, messages sent or received and unread totals.
+What changed is dispatched to the bus as regular events (``follow``,
+``message`` with ``truncated`` so receivers reload it, ``read`` for an unread
+total that moved for another reason than a received message), so database
+load grows with processes, not connections.
+
+Rows are matched with a ``created_at`` window that overlaps the previous tick
+(a row can commit after its timestamp) and de-duplicated by key. Events the
+process already published itself may be dispatched again; waiters treat them
+as a spurious wakeup.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, cast, func, literal, null, or_, select, union_all
+
+from . import db
+from .events import LocalEventBus, user_topic
+from .models import Conversation, Follow, Message
+
+log = logging.getLogger(__name__)
+
+# A row committed this long after its created_at is still picked up.
+OVERLAP = timedelta(seconds=10)
+# Users per query; larger sets are split into several statements.
+BATCH_SIZE = 500
+
+
+def _changes_query(user_ids: list[int], since: datetime):
+    follows = select(
+        literal("follow").label("kind"),
+        Follow.following_id.label("user_id"),
+        Follow.follower_id.label("ref_id"),
+        Follow.created_at.label("at"),
+        literal(0).label("value"),
+    ).where(Follow.following_id.in_(user_ids), Follow.created_at > since)
+    messages = select(
+        literal("message"),
+        Message.receiver_id,
+        Message.id,
+        Message.created_at,
+        Message.sender_id,
+    ).where(
+        or_(Message.receiver_id.in_(user_ids), Message.sender_id.in_(user_ids)),
+        Message.created_at > since,
+    )
+    unread = (
+        select(
+            literal("unread"),
+            Conversation.user_id,
+            literal(0),
+            cast(null(), DateTime),
+            func.sum(Conversation.unread_count),
+        )
+        .where(Conversation.user_id.in_(user_ids))
+        .group_by(Conversation.user_id)
+    )
+    return union_all(follows, messages, unread)
+
+
+class NotificationPoller:
+    def __init__(self, app, bus, interval: float) -> None:
+        self.app = app
+        self.bus = bus
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._checked_at = datetime.utcnow()
+        # Keys already dispatched, with their created_at for pruning.
+        self._seen: dict[tuple, datetime] = {}
+        self._unread: dict[int, int] = {}
+
+    def ensure_running(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._checked_at = datetime.utcnow()
+            self._thread = threading.Thread(
+                target=self._run, name="notification-poller", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            user_ids = self.bus.watched_user_ids()
+            if not user_ids:
+                self._unread.clear()
+                continue
+            try:
+                with self.app.app_context():
+                    self.tick(user_ids)
+            except Exception:  # noqa: BLE001 - keep the poller alive
+                log.exception("Notification poller tick failed; retrying.")
+
+    def tick(self, user_ids: list[int]) -> None:
+        """Query changes for ``user_ids`` since the last tick and dispatch them."""
+        now = datetime.utcnow()
+        since = self._checked_at - OVERLAP
+        rows = []
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start : start + BATCH_SIZE]
+            rows += db.session.execute(_changes_query(batch, since)).all()
+        db.session.remove()
+        self._checked_at = now
+
+        watched = set(user_ids)
+        unread = dict.fromkeys(user_ids, 0)
+        # Users this tick already woke with a message they received.
+        received = set()
+        for kind, user_id, ref_id, created_at, value in rows:
+            if kind == "unread":
+                unread[user_id] = int(value or 0)
+                continue
+            key = (kind, user_id, ref_id)
+            if key in self._seen:
+                continue
+            self._seen[key] = created_at
+            if kind == "follow":
+                self.bus.dispatch(
+                    user_topic(user_id), {"kind": "follow", "follower_id": ref_id}
+                )
+            else:
+                data = {
+                    "kind": "message",
+                    "id": ref_id,
+                    "sender_id": value,
+                    "receiver_id": user_id,
+                    "truncated": True,
+                }
+                for participant in {user_id, value} & watched:
+                    self.bus.dispatch(user_topic(participant), data)
+                received.add(user_id)
+
+        self._seen = {
+            key: created_at
+            for key, created_at in self._seen.items()
+            if created_at > since
+        }
+        for user_id, total in unread.items():
+            previous = self._unread.get(user_id)
+            # The first tick for a user only records the baseline, and a rise
+            # that comes with a received message needs no second event.
+            if previous is None or previous == total:
+                continue
+            if total > previous and user_id in received:
+                continue
+            self.bus.dispatch(user_topic(user_id), {"kind": "read"})
+        self._unread = unread
+
+
+def init_poller(app) -> NotificationPoller | None:
+    interval = app.config.get("NOTIFICATION_POLL_INTERVAL")
+    bus = app.extensions["event_bus"]
+    if interval is None:
+        # PostgreSQL LISTEN/NOTIFY already reaches every process.
+        interval = 1.0 if isinstance(bus, LocalEventBus) else 0
+    if not interval:
+        return None
+    bus.poller = NotificationPoller(app, bus, interval)
+    return bus.poller
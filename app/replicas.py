@@ -0,0 +1,176 @@
+"""Route the reads of read-only views to PostgreSQL replicas.
+
+Replicas are configured as Flask-SQLAlchemy binds (``replica_0``,
+``replica_1``…, from ``DATABASE_REPLICA_URLS``). Views decorated with
+:func:`replica_reads` send their plain ``SELECT`` statements to one healthy
+replica; everything else stays on the primary:
+
+* non-GET requests, and any request within ``REPLICA_MAX_LAG`` seconds of
+  the same browser session's last write (so the redirect after a POST reads
+  what was just written);
+* the rest of a request once it writes (flush, ``UPDATE``/``DELETE``) or
+  calls :func:`use_primary` — e.g. a long-poll woken by an event, which must
+  see the row that triggered it;
+* ``SELECT ... FOR UPDATE``.
+
+Reads behind a time cursor (notifications ``since``) are never routed here:
+the cursor advances past rows a lagging replica has not replayed yet.
+
+Replicas are probed at most every ``CHECK_INTERVAL`` seconds per process; one
+that is unreachable or lags more than ``REPLICA_MAX_LAG`` seconds is skipped
+until a later probe succeeds. With no healthy replica, reads use the primary.
+"""
+
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+log = logging.getLogger(__name__)
+
+BIND_PREFIX = "replica_"
+READ_BIND_KEY = "read_bind"
+PRIMARY_UNTIL_KEY = "_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+CHECK_INTERVAL = 10
+# Seconds behind the primary; 0 when every received WAL record is replayed
+# (an idle primary would otherwise look ever more "behind").
+LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        read_bind = self.info.get(READ_BIND_KEY)
+        if read_bind is not None and bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                # Writes go to the primary, and so does everything after them.
+                del self.info[READ_BIND_KEY]
+            elif isinstance(clause, Select) and clause._for_update_arg is None:
+                return self._db.engines[read_bind]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    def __init__(self, engines: dict, max_lag: float) -> None:
+        self.engines = engines
+        self.max_lag = max_lag
+        self._lock = threading.Lock()
+        # bind key -> (last probe, healthy); unknown replicas are probed first.
+        self._health = {key: (float("-inf"), False) for key in engines}
+        for key, engine in engines.items():
+            event.listen(engine, "handle_error", self._on_error(key))
+
+    def _on_error(self, key: str):
+        def mark_down(context) -> None:
+            if context.is_disconnect:
+                self._set_health(key, False)
+
+        return mark_down
+
+    def _set_health(self, key: str, healthy: bool) -> None:
+        with self._lock:
+            self._health[key] = (time.monotonic(), healthy)
+
+    def _probe(self, key: str) -> bool:
+        engine = self.engines[key]
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name != "postgresql":
+                    connection.execute(text("SELECT 1"))
+                    return True
+                lag = float(connection.execute(LAG_SQL).scalar())
+        except Exception:
+            log.warning("Réplica %s indisponível; lendo do primário.", key, exc_info=True)
+            return False
+        if lag > self.max_lag:
+            log.warning("Réplica %s atrasada %.1fs; lendo do primário.", key, lag)
+            return False
+        return True
+
+    def healthy(self) -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                key
+                for key, (checked_at, healthy) in self._health.items()
+                if now - checked_at >= CHECK_INTERVAL
+            ]
+            # Claim the probes so concurrent requests keep the previous verdict.
+            for key in stale:
+                self._health[key] = (now, self._health[key][1])
+        for key in stale:
+            self._set_health(key, self._probe(key))
+        return [key for key, (_, healthy) in self._health.items() if healthy]
+
+    def pick(self) -> str | None:
+        candidates = self.healthy()
+        return random.choice(candidates) if candidates else None
+
+
+def replica_binds(urls: list[str], engine_options) -> dict[str, dict]:
+    """``SQLALCHEMY_BINDS`` entries for the replica URLs."""
+    binds = {}
+    for index, url in enumerate(urls):
+        options = engine_options(url)
+        if url.startswith("postgresql"):
+            # Fail fast on a dead replica instead of hanging the request.
+            options["connect_args"] = {**options.get("connect_args", {}), "connect_timeout": 3}
+        binds[f"{BIND_PREFIX}{index}"] = {"url": url, **options}
+    return binds
+
+
+def init_replicas(app) -> ReplicaRouter | None:
+    keys = [key for key in app.config.get("SQLALCHEMY_BINDS", {}) if key.startswith(BIND_PREFIX)]
+    if not keys:
+        return None
+    with app.app_context():
+        engines = app.extensions["sqlalchemy"].engines
+        router = ReplicaRouter({key: engines[key] for key in keys}, app.config["REPLICA_MAX_LAG"])
+    app.extensions["replicas"] = router
+
+    @app.after_request
+    def remember_write(response):
+        if request.method not in SAFE_METHODS:
+            session[PRIMARY_UNTIL_KEY] = time.time() + router.max_lag
+        return response
+
+    return router
+
+
+def use_replica() -> str | None:
+    """Route this request's reads to a replica when that is safe; returns its key."""
+    router = current_app.extensions.get("replicas")
+    if router is None or request.method not in SAFE_METHODS:
+        return None
+    if session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+        return None
+    key = router.pick()
+    if key is not None:
+        current_app.extensions["sqlalchemy"].session.info[READ_BIND_KEY] = key
+    return key
+
+
+def use_primary() -> None:
+    """Read from the primary for the rest of this request."""
+    current_app.extensions["sqlalchemy"].session.info.pop(READ_BIND_KEY, None)
+
+
+def replica_reads(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        use_replica()
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,82 @@
+"""Album and profile search.
+
+On PostgreSQL the queries are served by ``pg_trgm`` GIN indexes (created by
+``scripts/upgrade_schema.py``) and ranked by trigram similarity. Other
+databases, such as the SQLite files used in development, fall back to plain
+``LIKE`` matching ranked by exact/prefix hits.
+"""
+
+from sqlalchemy import case, func, or_
+
+from . import db
+from .models import AlbumMaster, User
+
+
+def _uses_trigrams() -> bool:
+    return db.session.get_bind().dialect.name == "postgresql"
+
+
+def _contains_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _prefix_rank(column, term: str):
+    """Fallback relevance: exact match, then prefix match, then substring."""
+    prefix = _contains_pattern(term)[1:]
+    return case(
+        (column == term, 3),
+        (column.like(prefix, escape="\\"), 2),
+        else_=1,
+    )
+
+
+def search_album_masters(term: str, limit: int) -> list[AlbumMaster]:
+    """Top ``limit`` album masters for ``term``, most relevant first."""
+    term = term.strip().lower()
+    if not term:
+        return []
+    pattern = _contains_pattern(term)
+    query = AlbumMaster.query.filter(
+        or_(
+            AlbumMaster.title_key.like(pattern, escape="\\"),
+            AlbumMaster.artist_key.like(pattern, escape="\\"),
+        )
+    )
+    if _uses_trigrams():
+        score = func.greatest(
+            func.similarity(AlbumMaster.title_key, term),
+            func.similarity(AlbumMaster.artist_key, term),
+        )
+    else:
+        score = func.max(
+            _prefix_rank(AlbumMaster.title_key, term),
+            _prefix_rank(AlbumMaster.artist_key, term),
+        )
+    return (
+        query.order_by(score.desc(), AlbumMaster.created_at.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def search_users(term: str, limit: int, exclude_id: int | None = None) -> list[User]:
+    """Top ``limit`` profiles whose username or bio matches ``term``."""
+    term = term.strip().lower()
+    if not term:
+        return []
+    pattern = _contains_pattern(term)
+    username_key, bio_key = func.lower(User.username), func.lower(User.bio)
+    query = User.query.filter(
+        or_(
+            username_key.like(pattern, escape="\\"),
+            bio_key.like(pattern, escape="\\"),
+        )
+    )
+    if exclude_id is not None:
+        query = query.filter(User.id != exclude_id)
+    if _uses_trigrams():
+        score = func.similarity(username_key, term)
+    else:
+        score = _prefix_rank(username_key, term)
+    return query.order_by(score.desc(), User.username.asc()).limit(limit).all()
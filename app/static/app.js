@@ -18,12 +18,15 @@
   const chatPage = setupChat(chatContacts);
   setupAlbumSearch();
   setupReactionForms();
+  setupInfiniteLists();
 
   let lastNotificationCheck = null;
   let lastUnreadTotal = 0;
   let notificationController = null;
   let notificationsPaused = false;
   let notificationRetryHandle = null;
+  let eventStream = null;
+  let streamUnavailable = !("EventSource" in window);
 
   function setBadge(badgeEl, parentEl, count) {
     if (!badgeEl || !parentEl) {
@@ -77,45 +80,8 @@
       })
       .then((data) => {
         notificationController = null;
-        lastNotificationCheck = data.server_time || new Date().toISOString();
-        const newMessages = Array.isArray(data.new_messages)
-          ? data.new_messages
-          : [];
-        const totalUnreadFromResponse = Number(data.total_unread_messages);
-        const hasTotalUnread =
-          Number.isFinite(totalUnreadFromResponse) && totalUnreadFromResponse >= 0;
-        if (hasTotalUnread) {
-          lastUnreadTotal = totalUnreadFromResponse;
-        }
-
-        const fallbackMessageCount = newMessages.reduce((sum, item) => {
-          const value = safeNumber(item && item.unread_count);
-          if (value > 0) {
-            return sum + value;
-          }
-          return sum + 1;
-        }, 0);
-        const badgeCount = hasTotalUnread
-          ? totalUnreadFromResponse
-          : fallbackMessageCount;
-        setBadge(messageBadge, messageNavItem, badgeCount);
-        if (chatContacts) {
-          chatContacts.updateFromNotifications(newMessages);
-        }
-
-        if (
-          chatPage &&
-          newMessages.some(
-            (item) =>
-              item &&
-              item.from_user &&
-              safeNumber(item.from_user.id) === chatPage.selectedUserId,
-          )
-        ) {
-          chatPage.refreshNow();
-        }
-
-        requestNotifications(true);
+        applyNotifications(data);
+        continueNotifications();
       })
       .catch((error) => {
         notificationController = null;
@@ -123,13 +89,122 @@
           return;
         }
         if (error.name === "AbortError") {
-          requestNotifications(true);
+          continueNotifications();
           return;
         }
         scheduleNotificationRetry();
       });
   }
 
+  function applyNotifications(data) {
+    lastNotificationCheck = data.server_time || new Date().toISOString();
+    const newMessages = Array.isArray(data.new_messages)
+      ? data.new_messages
+      : [];
+    const totalUnreadFromResponse = Number(data.total_unread_messages);
+    const hasTotalUnread =
+      Number.isFinite(totalUnreadFromResponse) && totalUnreadFromResponse >= 0;
+    if (hasTotalUnread) {
+      lastUnreadTotal = totalUnreadFromResponse;
+    }
+
+    const fallbackMessageCount = newMessages.reduce((sum, item) => {
+      const value = safeNumber(item && item.unread_count);
+      if (value > 0) {
+        return sum + value;
+      }
+      return sum + 1;
+    }, 0);
+    const badgeCount = hasTotalUnread
+      ? totalUnreadFromResponse
+      : fallbackMessageCount;
+    setBadge(messageBadge, messageNavItem, badgeCount);
+    if (chatContacts) {
+      chatContacts.updateFromNotifications(newMessages);
+    }
+
+    if (
+      chatPage &&
+      !eventStream &&
+      newMessages.some(
+        (item) =>
+          item &&
+          item.from_user &&
+          safeNumber(item.from_user.id) === chatPage.selectedUserId,
+      )
+    ) {
+      chatPage.refreshNow();
+    }
+  }
+
+  function continueNotifications() {
+    if (!openEventStream()) {
+      requestNotifications(true);
+    }
+  }
+
+  function parseEventData(event) {
+    try {
+      return JSON.parse(event.data);
+    } catch (error) {
+      return null;
+    }
+  }
+
+  function openEventStream() {
+    if (eventStream) {
+      return true;
+    }
+    if (streamUnavailable || notificationsPaused) {
+      return false;
+    }
+
+    const source = new EventSource("/api/stream");
+    eventStream = source;
+
+    source.addEventListener("open", () => {
+      if (chatPage) {
+        chatPage.attachStream();
+        chatPage.refreshNow();
+      }
+      // Catch up on anything committed before the stream subscribed.
+      requestNotifications(false);
+    });
+    source.addEventListener("message", (event) => {
+      const message = parseEventData(event);
+      if (message && chatPage) {
+        chatPage.receiveMessage(message);
+      }
+    });
+    source.addEventListener("notifications", (event) => {
+      const data = parseEventData(event);
+      if (data) {
+        applyNotifications(data);
+      }
+    });
+    source.addEventListener("error", () => {
+      if (source.readyState !== EventSource.CLOSED) {
+        // The browser reconnects on its own, resuming from Last-Event-ID.
+        return;
+      }
+      // Stream refused (e.g. served without the ASGI entry point): long-poll.
+      closeEventStream();
+      streamUnavailable = true;
+      if (chatPage) {
+        chatPage.detachStream();
+      }
+      requestNotifications(true);
+    });
+    return true;
+  }
+
+  function closeEventStream() {
+    if (eventStream) {
+      eventStream.close();
+      eventStream = null;
+    }
+  }
+
   function scheduleNotificationRetry() {
     if (notificationsPaused) {
       return;
@@ -145,6 +220,7 @@
 
   function pauseNotifications() {
     notificationsPaused = true;
+    closeEventStream();
     if (notificationRetryHandle) {
       clearTimeout(notificationRetryHandle);
       notificationRetryHandle = null;
@@ -234,11 +310,18 @@
     }
 
     let lastMessageId = safeNumber(thread.dataset.lastMessageId);
+    let oldestMessageId = safeNumber(thread.dataset.oldestMessageId);
+    let historyTrigger = messagesContainer.querySelector("[data-chat-history-more]");
+    let historyObserver = null;
+    let historyLoading = false;
     let messageController = null;
     let messageRetryHandle = null;
     let forceImmediateAfterAbort = false;
     let pollingPaused = false;
     let readReceiptController = null;
+    let streaming = false;
+    let chatSocket = null;
+    const chatForm = thread.querySelector(".chat-form");
 
     function ensureScroll() {
       window.requestAnimationFrame(() => {
@@ -303,6 +386,116 @@
       ensureScroll();
     }
 
+    function prependMessages(messages) {
+      const previousHeight = messagesContainer.scrollHeight;
+      const previousTop = messagesContainer.scrollTop;
+      const fragment = document.createDocumentFragment();
+
+      messages.forEach((message) => {
+        const numericId = safeNumber(message && message.id);
+        if (
+          !numericId ||
+          messagesContainer.querySelector('[data-message-id="' + numericId + '"]')
+        ) {
+          return;
+        }
+        fragment.appendChild(
+          renderMessage({
+            id: numericId,
+            from_me: Boolean(message.from_me),
+            content: message.content || "",
+            created_at: message.created_at,
+          }),
+        );
+        oldestMessageId = oldestMessageId
+          ? Math.min(oldestMessageId, numericId)
+          : numericId;
+      });
+
+      const anchor = historyTrigger
+        ? historyTrigger.nextSibling
+        : messagesContainer.firstChild;
+      messagesContainer.insertBefore(fragment, anchor);
+      // Keep the messages the user was reading where they were.
+      messagesContainer.scrollTop =
+        previousTop + (messagesContainer.scrollHeight - previousHeight);
+    }
+
+    function finishHistory() {
+      if (historyObserver) {
+        historyObserver.disconnect();
+        historyObserver = null;
+      }
+      if (historyTrigger) {
+        historyTrigger.remove();
+        historyTrigger = null;
+      }
+    }
+
+    function loadOlderMessages() {
+      if (historyLoading || !historyTrigger || !oldestMessageId) {
+        return;
+      }
+      historyLoading = true;
+      historyTrigger.classList.add("loading");
+
+      const url = new URL(`/api/chat/${selectedUserId}/messages`, origin);
+      url.searchParams.set("before", String(oldestMessageId));
+      fetch(url.toString(), {
+        headers: { Accept: "application/json" },
+        credentials: "same-origin",
+      })
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error("Erro ao buscar mensagens");
+          }
+          return response.json();
+        })
+        .then((data) => {
+          historyLoading = false;
+          if (historyTrigger) {
+            historyTrigger.classList.remove("loading");
+          }
+          prependMessages(Array.isArray(data.messages) ? data.messages : []);
+          if (!data.has_more) {
+            finishHistory();
+          }
+        })
+        .catch(() => {
+          historyLoading = false;
+          if (historyTrigger) {
+            historyTrigger.classList.remove("loading");
+          }
+          showTransientToast("Não foi possível carregar mensagens anteriores.");
+        });
+    }
+
+    function setupHistory() {
+      if (!historyTrigger) {
+        return;
+      }
+      historyTrigger.addEventListener("click", (event) => {
+        event.preventDefault();
+        loadOlderMessages();
+      });
+      if ("IntersectionObserver" in window) {
+        historyObserver = new IntersectionObserver(
+          (entries) => {
+            if (entries.some((entry) => entry.isIntersecting)) {
+              loadOlderMessages();
+            }
+          },
+          { root: messagesContainer, rootMargin: "200px 0px" },
+        );
+        // Start observing once the thread is scrolled to the latest message.
+        window.requestAnimationFrame(() => {
+          if (historyObserver && historyTrigger) {
+            historyObserver.observe(historyTrigger);
+          }
+        });
+      }
+    }
+
     function clearMessageRetry() {
       if (messageRetryHandle) {
         clearTimeout(messageRetryHandle);
@@ -348,7 +541,7 @@
     }
 
     function startLongPoll(waitForUpdates) {
-      if (pollingPaused) {
+      if (pollingPaused || (streaming && waitForUpdates)) {
         return;
       }
 
@@ -451,14 +644,112 @@
 
     function dispose() {
       pausePolling();
+      finishHistory();
+      if (chatSocket) {
+        chatSocket.close();
+      }
+    }
+
+    function receiveMessage(message) {
+      const senderId = safeNumber(message.sender_id);
+      const receiverId = safeNumber(message.receiver_id);
+      if (senderId !== selectedUserId && receiverId !== selectedUserId) {
+        return;
+      }
+      // The socket and the event stream may both deliver the same message.
+      if (
+        messagesContainer.querySelector(
+          '[data-message-id="' + safeNumber(message.id) + '"]',
+        )
+      ) {
+        return;
+      }
+      const entry = {
+        id: safeNumber(message.id),
+        from_me: senderId !== selectedUserId || senderId === receiverId,
+        content: message.content,
+        created_at: message.created_at,
+      };
+      appendMessages([entry]);
+      if (!entry.from_me && !pollingPaused) {
+        sendReadReceipt(entry);
+        if (contactsSync && contactsSync.markAsRead) {
+          contactsSync.markAsRead(selectedUserId);
+        }
+      }
+    }
+
+    function attachStream() {
+      streaming = true;
+      clearMessageRetry();
+      if (messageController) {
+        messageController.abort();
+      }
+    }
+
+    function detachStream() {
+      streaming = false;
+      forceRefresh();
+    }
+
+    function openChatSocket() {
+      if (!("WebSocket" in window) || !chatForm) {
+        return;
+      }
+      const scheme = window.location.protocol === "https:" ? "wss:" : "ws:";
+      const socket = new WebSocket(`${scheme}//${window.location.host}/ws/chat`);
+
+      socket.addEventListener("open", () => {
+        chatSocket = socket;
+      });
+      socket.addEventListener("message", (event) => {
+        let frame = null;
+        try {
+          frame = JSON.parse(event.data);
+        } catch (error) {
+          return;
+        }
+        if (frame && frame.type === "message") {
+          receiveMessage(frame);
+        } else if (frame && frame.type === "error") {
+          showTransientToast(frame.error);
+        }
+      });
+      socket.addEventListener("close", () => {
+        // Sending falls back to the regular form POST.
+        chatSocket = null;
+      });
+    }
+
+    if (chatForm) {
+      chatForm.addEventListener("submit", (event) => {
+        if (!chatSocket || chatSocket.readyState !== WebSocket.OPEN) {
+          return;
+        }
+        const textarea = chatForm.querySelector('textarea[name="content"]');
+        const content = textarea ? textarea.value.trim() : "";
+        if (!content) {
+          return;
+        }
+        event.preventDefault();
+        chatSocket.send(
+          JSON.stringify({ type: "send", to: selectedUserId, content }),
+        );
+        textarea.value = "";
+      });
     }
 
     ensureScroll();
+    setupHistory();
     startLongPoll(true);
+    openChatSocket();
 
     return {
       selectedUserId,
       refreshNow: forceRefresh,
+      receiveMessage,
+      attachStream,
+      detachStream,
       onVisibilityChange: () => {
         if (document.visibilityState === "hidden") {
           pausePolling();
@@ -691,6 +982,85 @@
     });
   }
 
+  function setupInfiniteLists() {
+    document.querySelectorAll("[data-infinite-list]").forEach((list) => {
+      const endpoint = list.dataset.endpoint;
+      const trigger =
+        list.parentElement &&
+        list.parentElement.querySelector("[data-infinite-more]");
+      if (!endpoint || !trigger) {
+        return;
+      }
+
+      let nextCursor = list.dataset.nextCursor || "";
+      let loading = false;
+      let observer = null;
+
+      function finish() {
+        if (observer) {
+          observer.disconnect();
+          observer = null;
+        }
+        trigger.remove();
+      }
+
+      function loadMore() {
+        if (loading || !nextCursor) {
+          return;
+        }
+        loading = true;
+        trigger.classList.add("loading");
+
+        const url = new URL(endpoint, origin);
+        url.searchParams.set("cursor", nextCursor);
+        fetch(url.toString(), {
+          headers: { Accept: "application/json" },
+          credentials: "same-origin",
+        })
+          .then((response) => {
+            if (!response.ok) {
+              throw new Error("Erro ao carregar mais itens");
+            }
+            return response.json();
+          })
+          .then((data) => {
+            loading = false;
+            trigger.classList.remove("loading");
+            if (data.html) {
+              list.insertAdjacentHTML("beforeend", data.html);
+            }
+            nextCursor = data.next_cursor || "";
+            list.dataset.nextCursor = nextCursor;
+            if (!nextCursor) {
+              finish();
+            }
+          })
+          .catch(() => {
+            loading = false;
+            trigger.classList.remove("loading");
+            showTransientToast("Não foi possível carregar mais agora.");
+          });
+      }
+
+      trigger.addEventListener("click", (event) => {
+        event.preventDefault();
+        loadMore();
+      });
+
+      if ("IntersectionObserver" in window) {
+        observer = new IntersectionObserver(
+          (entries) => {
+            if (entries.some((entry) => entry.isIntersecting)) {
+              loadMore();
+            }
+          },
+          { rootMargin: "400px 0px" },
+        );
+        observer.observe(trigger);
+      }
+    });
+  }
+
   function showTransientToast(message) {
     if (!message) {
       return;
@@ -1,13 +1,44 @@
+"""Uploaded images: validation, metadata stripping and resized derivatives.
+
+With Pillow installed, an upload is decoded to check its real format and
+re-encoded without EXIF/XMP/comments (keeping the colour profile), animated
+GIF/WebP frame by frame. Pages ask for ``image_url(size)`` and get a
+derivative that fits ``THUMBNAIL_SIZES`` (WebP, or JPEG when Pillow lacks
+WebP), written next to the uploads on first request and served as a static
+file from then on. Without Pillow, uploads are stored as sent and every size
+falls back to the original.
+"""
+
+import logging
 import os
 import shutil
 import uuid
 from typing import Optional
 
-from flask import current_app
+from flask import current_app, url_for
 from werkzeug.datastructures import FileStorage
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
+try:
+    from PIL import Image, ImageOps, ImageSequence, features
+except ImportError:  # optional: uploads are then stored and served as sent
+    Image = None
+
+log = logging.getLogger(__name__)
+
 ALLOWED_IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+# Pillow format name -> stored extension.
+IMAGE_FORMATS = {"PNG": "png", "JPEG": "jpg", "GIF": "gif", "WEBP": "webp"}
+THUMBNAIL_SIZES = (64, 256, 1024)
+THUMBNAIL_DIR = "thumbs"
+THUMBNAIL_QUALITY = 82
+# Animated uploads are decoded whole to strip their metadata.
+MAX_ANIMATION_FRAMES = 500
+
+
+def _static_dir() -> str:
+    return os.path.join(current_app.root_path, "static")
 
 
 def _ensure_upload_folder() -> str:
@@ -16,6 +47,63 @@ def _ensure_upload_folder() -> str:
     return upload_dir
 
 
+def _open_upload(file_storage: FileStorage):
+    """Decode an upload, rejecting anything that is not a supported image."""
+    try:
+        image = Image.open(file_storage.stream)
+        image.load()
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise ValueError("Arquivo de imagem inválido ou corrompido.") from exc
+    if image.format not in IMAGE_FORMATS:
+        raise ValueError("Formato de imagem não suportado. Use PNG/JPG/GIF/WEBP.")
+    return image
+
+
+def _save_clean(image, file_path: str) -> None:
+    """Re-encode ``image`` without its metadata (the colour profile stays)."""
+    image_format = image.format
+    params = {}
+    if image.info.get("icc_profile"):
+        params["icc_profile"] = image.info["icc_profile"]
+    if "transparency" in image.info:
+        params["transparency"] = image.info["transparency"]
+    if image_format in ("JPEG", "WEBP"):
+        params["quality"] = 90
+    clean = ImageOps.exif_transpose(image)
+    # Encoders fall back to image.info for some chunks (e.g. JPEG comments).
+    clean.info = {}
+    clean.save(file_path, image_format, **params)
+
+
+def _save_clean_animation(image, file_path: str) -> None:
+    """Re-encode every frame of an animated GIF/WebP, keeping only its timing."""
+    if image.n_frames > MAX_ANIMATION_FRAMES:
+        raise ValueError("Animação longa demais para ser enviada.")
+    frames, durations = [], []
+    try:
+        for frame in ImageSequence.Iterator(image):
+            clean = frame.copy()
+            # WebP only fills in the frame timing once it is decoded.
+            durations.append(frame.info.get("duration", 100))
+            clean.info = {
+                key: value for key, value in frame.info.items() if key == "transparency"
+            }
+            frames.append(clean)
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise ValueError("Arquivo de imagem inválido ou corrompido.") from exc
+    params = {"save_all": True, "append_images": frames[1:], "duration": durations}
+    if "loop" in image.info:
+        params["loop"] = image.info["loop"]
+    if image.info.get("icc_profile"):
+        params["icc_profile"] = image.info["icc_profile"]
+    if image.format == "WEBP":
+        params["quality"] = 90
+    else:
+        # Frames are decoded whole, so each one replaces the previous.
+        params["disposal"] = 2
+    frames[0].save(file_path, image.format, **params)
+
+
 def save_image(file_storage: Optional[FileStorage]) -> str:
     """Save a FileStorage image into the static uploads directory."""
     if not file_storage or not file_storage.filename:
@@ -29,10 +117,20 @@ def save_image(file_storage: Optional[FileStorage]) -> str:
     if ext not in ALLOWED_IMAGE_EXTENSIONS:
         raise ValueError("Formato de imagem não suportado. Use PNG/JPG/GIF/WEBP.")
 
+    image = None
+    if Image is not None:
+        image = _open_upload(file_storage)
+        ext = IMAGE_FORMATS[image.format]
+
     unique_name = f"{uuid.uuid4().hex}.{ext}"
     upload_dir = _ensure_upload_folder()
     file_path = os.path.join(upload_dir, unique_name)
-    file_storage.save(file_path)
+    if image is None:
+        file_storage.save(file_path)
+    elif getattr(image, "is_animated", False):
+        _save_clean_animation(image, file_path)
+    else:
+        _save_clean(image, file_path)
 
     static_dir = os.path.join(current_app.root_path, "static")
     relative_path = os.path.relpath(file_path, static_dir)
@@ -69,8 +167,113 @@ def delete_image(relative_path: str) -> None:
         return
     static_dir = os.path.join(current_app.root_path, "static")
     file_path = os.path.join(static_dir, relative_path)
-    if os.path.isfile(file_path):
-        try:
-            os.remove(file_path)
-        except OSError:
-            pass
+    paths = [file_path]
+    if Image is not None:
+        paths += [
+            os.path.join(static_dir, variant_path(relative_path, size))
+            for size in THUMBNAIL_SIZES
+        ]
+    for path in paths:
+        if os.path.isfile(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _variant_format() -> tuple[str, str]:
+    return ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+
+
+def variant_size(size: int) -> int:
+    """The smallest derivative at least ``size`` px wide (or the largest one)."""
+    for candidate in THUMBNAIL_SIZES:
+        if candidate >= size:
+            return candidate
+    return THUMBNAIL_SIZES[-1]
+
+
+def variant_path(relative_path: str, size: int) -> str:
+    """Static path of the ``size`` px derivative of ``relative_path``."""
+    upload_dir = os.path.relpath(current_app.config["UPLOAD_FOLDER"], _static_dir())
+    stem = os.path.splitext(relative_path)[0].replace("/", "_")
+    _, ext = _variant_format()
+    path = os.path.join(upload_dir, THUMBNAIL_DIR, str(size), f"{stem}.{ext}")
+    return path.replace("\\", "/")
+
+
+def _upload_source(relative_path: str) -> Optional[str]:
+    """Absolute path of ``relative_path`` if it names a file saved by
+    :func:`save_image` (directly in the upload folder, so never a derivative)."""
+    source = safe_join(_static_dir(), relative_path)
+    if source is None:
+        return None
+    source = os.path.realpath(source)
+    upload_dir = os.path.realpath(current_app.config["UPLOAD_FOLDER"])
+    if os.path.dirname(source) != upload_dir:
+        return None
+    return source
+
+
+def is_upload(relative_path: str) -> bool:
+    return _upload_source(relative_path) is not None
+
+
+def ensure_variant(relative_path: str, size: int) -> Optional[str]:
+    """Build the derivative if it is missing; returns its static path.
+
+    ``None`` when it cannot be built (no Pillow, unknown size, not an upload,
+    missing or undecodable source).
+    """
+    if Image is None or size not in THUMBNAIL_SIZES:
+        return None
+    source = _upload_source(relative_path)
+    if source is None or not os.path.isfile(source):
+        return None
+    static_dir = _static_dir()
+    target_path = variant_path(relative_path, size)
+    target = os.path.join(static_dir, target_path)
+    if os.path.isfile(target):
+        return target_path
+
+    image_format, _ = _variant_format()
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Concurrent first requests each write their own file; the last one wins.
+    partial = f"{target}.{uuid.uuid4().hex}.tmp"
+    try:
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        if image_format == "JPEG" or not has_alpha:
+            if has_alpha:
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image.convert("RGBA"), mask=image.convert("RGBA"))
+                image = background
+            image = image.convert("RGB")
+        else:
+            image = image.convert("RGBA")
+        image.save(partial, image_format, quality=THUMBNAIL_QUALITY)
+        os.replace(partial, target)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        log.warning("Não foi possível gerar a miniatura de %s.", relative_path, exc_info=True)
+        if os.path.exists(partial):
+            os.remove(partial)
+        return None
+    return target_path
+
+
+def image_url(value: Optional[str], size: Optional[int] = None) -> str:
+    """URL of a stored image; with ``size``, of its derivative at least that wide."""
+    if not value:
+        return ""
+    if value.startswith("http://") or value.startswith("https://"):
+        return value
+    if size is None or Image is None or not is_upload(value):
+        return url_for("static", filename=value)
+    size = variant_size(size)
+    path = variant_path(value, size)
+    if os.path.isfile(os.path.join(_static_dir(), path)):
+        return url_for("static", filename=path)
+    # Built on first request by main.image_variant.
+    return url_for("main.image_variant", size=size, filename=value)
@@ -0,0 +1,91 @@
+"""Fan-out-on-write feed timeline backed by the ``feed_entries`` table.
+
+When ``FEED_FANOUT`` is enabled every review is copied into the timeline of
+its author and of each follower at write time, so reading a feed becomes an
+indexed range scan on ``(user_id, created_at, review_id)``.
+"""
+
+from flask import current_app
+from sqlalchemy import delete, exists, insert, literal, select, union_all
+
+from . import db
+from .models import FeedEntry, Follow, Review
+
+TIMELINE_COLUMNS = ["user_id", "review_id", "created_at"]
+
+
+def fanout_enabled() -> bool:
+    return bool(current_app.config.get("FEED_FANOUT"))
+
+
+def fan_out_review(review: Review) -> None:
+    """Push a freshly flushed review into its author's and followers' timelines."""
+    follower_rows = select(
+        Follow.follower_id,
+        literal(review.id),
+        literal(review.created_at),
+    ).where(Follow.following_id == review.user_id)
+    db.session.execute(insert(FeedEntry).from_select(TIMELINE_COLUMNS, follower_rows))
+    db.session.add(
+        FeedEntry(
+            user_id=review.user_id,
+            review_id=review.id,
+            created_at=review.created_at,
+        )
+    )
+
+
+def backfill_follow(follower_id: int, following_id: int) -> None:
+    """Copy the followed user's existing reviews into the follower's timeline."""
+    review_rows = select(
+        literal(follower_id),
+        Review.id,
+        Review.created_at,
+    ).where(
+        Review.user_id == following_id,
+        ~exists().where(
+            FeedEntry.user_id == follower_id,
+            FeedEntry.review_id == Review.id,
+        ),
+    )
+    db.session.execute(insert(FeedEntry).from_select(TIMELINE_COLUMNS, review_rows))
+
+
+def prune_follow(follower_id: int, following_id: int) -> None:
+    """Drop the unfollowed user's reviews from the follower's timeline."""
+    db.session.execute(
+        delete(FeedEntry)
+        .where(FeedEntry.user_id == follower_id)
+        .where(
+            FeedEntry.review_id.in_(
+                select(Review.id).where(Review.user_id == following_id)
+            )
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_timelines() -> int:
+    """Recompute every timeline from ``follows`` and ``reviews``.
+
+    Returns the number of rows written. The caller commits.
+    """
+    db.session.execute(delete(FeedEntry))
+    own_reviews = select(Review.user_id, Review.id, Review.created_at)
+    followed_reviews = select(
+        Follow.follower_id, Review.id, Review.created_at
+    ).join(Follow, Follow.following_id == Review.user_id)
+    db.session.execute(
+        insert(FeedEntry).from_select(
+            TIMELINE_COLUMNS, union_all(own_reviews, followed_reviews)
+        )
+    )
+    return db.session.query(FeedEntry).count()
+
+
+def timeline_query(user_id: int):
+    """Reviews in ``user_id``'s materialized timeline, keyset-ready."""
+    return (
+        Review.query.join(FeedEntry, FeedEntry.review_id == Review.id)
+        .filter(FeedEntry.user_id == user_id)
+    )
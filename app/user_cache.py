@@ -0,0 +1,146 @@
+"""Short-lived caches for the logged-in user and their follow graph.
+
+Every request used to load the user row in the Flask-Login loader and then
+lazy-load ``following``/``followers`` whole just to test membership. Both are
+now cached per process for ``CACHE_TTL`` seconds, and per request in ``g`` so
+one request sees a single consistent value:
+
+* the user's column values, attached to the request's session with
+  ``merge(load=False)`` (no query; relationships still lazy-load);
+* the ids they follow and the ids following them, as frozensets.
+
+Writes in this process call :func:`forget_user` / :func:`forget_follow`;
+other processes pick changes up when the entry expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_app_context
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db, login_manager
+from .models import Follow, User
+
+CACHE_TTL = 30
+MAX_ENTRIES = 10000
+
+
+class _TTLCache:
+    def __init__(self, ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_cache = _TTLCache(CACHE_TTL, MAX_ENTRIES)
+
+
+def _request_cache() -> dict:
+    if "user_cache" not in g:
+        g.user_cache = {}
+    return g.user_cache
+
+
+def _cached(key, load):
+    per_request = _request_cache()
+    if key in per_request:
+        return per_request[key]
+    value = _cache.get(key)
+    if value is None:
+        value = load()
+        if value is not None:
+            _cache.set(key, value)
+    per_request[key] = value
+    return value
+
+
+def _user_values(user_id: int) -> dict | None:
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+def cached_user(user_id: int) -> User | None:
+    values = _cached(("user", user_id), lambda: _user_values(user_id))
+    if values is None:
+        return None
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+@login_manager.user_loader
+def load_user(user_id: str):
+    return cached_user(int(user_id))
+
+
+def following_ids(user_id: int) -> frozenset[int]:
+    """Ids of the users ``user_id`` follows."""
+    return _cached(
+        ("following", user_id),
+        lambda: frozenset(
+            db.session.scalars(
+                select(Follow.following_id).where(Follow.follower_id == user_id)
+            )
+        ),
+    )
+
+
+def follower_ids(user_id: int) -> frozenset[int]:
+    """Ids of the users following ``user_id``."""
+    return _cached(
+        ("followers", user_id),
+        lambda: frozenset(
+            db.session.scalars(
+                select(Follow.follower_id).where(Follow.following_id == user_id)
+            )
+        ),
+    )
+
+
+def contact_ids(user_id: int) -> frozenset[int]:
+    """Users ``user_id`` may chat with: anyone they follow or who follows them."""
+    return following_ids(user_id) | follower_ids(user_id)
+
+
+def _forget(*keys) -> None:
+    per_request = _request_cache() if has_app_context() else {}
+    for key in keys:
+        _cache.discard(key)
+        per_request.pop(key, None)
+
+
+def forget_user(user_id: int) -> None:
+    _forget(("user", user_id))
+
+
+def forget_follow(follower_id: int, following_id: int) -> None:
+    _forget(("following", follower_id), ("followers", following_id))
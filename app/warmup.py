@@ -0,0 +1,69 @@
+"""Explicit start-up phase, run once per process before serving requests.
+
+Replaces the old lazy ``db.create_all()`` in a ``before_request`` hook: the
+schema is migrated (``AUTO_MIGRATE``) or checked against the latest migration,
+the connection pool is filled, Jinja templates are compiled and the album
+autocomplete index is loaded, so a fresh worker's first user request is not
+the one paying for all of that.
+"""
+
+import logging
+
+from sqlalchemy import text
+
+from . import db
+from .autocomplete import album_index
+from .migrations import MIGRATIONS, current_version, migrate
+
+log = logging.getLogger(__name__)
+
+
+def _check_schema(auto_migrate: bool) -> None:
+    if auto_migrate:
+        migrate(report=log.info)
+        return
+    version, latest = current_version(), MIGRATIONS[-1].version
+    if version < latest:
+        raise RuntimeError(
+            f"Schema na versão {version}, a aplicação espera {latest}: "
+            "rode scripts/upgrade_schema.py (ou defina AUTO_MIGRATE=1)."
+        )
+
+
+def _prime_pool() -> int:
+    """Open (and ping) up to ``pool_size`` connections, then return them."""
+    pool = db.engine.pool
+    size = pool.size() if hasattr(pool, "size") else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connection = db.engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def _compile_templates(app) -> int:
+    names = app.jinja_env.list_templates(extensions=["html"])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_up(app, auto_migrate: bool | None = None) -> None:
+    if auto_migrate is None:
+        auto_migrate = app.config.get("AUTO_MIGRATE", False)
+    with app.app_context():
+        _check_schema(auto_migrate)
+        connections = _prime_pool()
+        templates = _compile_templates(app)
+        album_index.reload()
+        db.session.remove()
+    log.info(
+        "Warm-up concluído: %d conexões, %d templates compilados.",
+        connections,
+        templates,
+    )
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Run EXPLAIN on the queries behind the main pages and report sequential scans.
+
+The pages are requested through Flask's test client as an existing user, every
+SELECT they issue is captured and then explained. By default the planner runs
+with ``enable_seqscan = off``: a sequential scan that survives means no index
+can serve the query at all, which is what a missing-index regression looks
+like even on a small database. ``--planner-default`` explains with the normal
+cost model instead. Exits with status 1 when sequential scans are found.
+
+Only GET pages that do not write are requested; PostgreSQL only.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+import re
+import subprocess
+import sys
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import event, func
+
+from app import create_app, db
+from app.main import _encode_cursor
+from app.models import Album, Follow, Message, Review, User
+
+SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+# Cursor that sorts after every row, so the "next page" queries run too.
+FAR_CURSOR = _encode_cursor(datetime(2100, 1, 1), 2**31 - 1)
+
+
+def _sample_user() -> User | None:
+    """The user with the most reviews: their pages exercise the most queries."""
+    row = (
+        db.session.query(Review.user_id, func.count(Review.id).label("total"))
+        .group_by(Review.user_id)
+        .order_by(func.count(Review.id).desc())
+        .first()
+    )
+    if row:
+        return db.session.get(User, row.user_id)
+    return User.query.order_by(User.id).first()
+
+
+def _pages(user: User) -> list[str]:
+    pages = [
+        "/feed",
+        f"/api/feed?cursor={FAR_CURSOR}",
+        f"/profile/{user.username}",
+        f"/profile/{user.username}/collection",
+        "/albums",
+        "/chat",
+        "/api/notifications?since=2000-01-01T00:00:00Z",
+        "/search?q=a",
+        "/api/albums/search?q=a",
+    ]
+    album = Album.query.filter_by(user_id=user.id).first()
+    if album:
+        pages += [
+            f"/albums/{album.id}",
+            f"/api/albums/{album.id}/reviews?cursor={FAR_CURSOR}",
+        ]
+    review = Review.query.filter_by(user_id=user.id).first()
+    if review:
+        pages.append(f"/reviews/{review.id}")
+    contact = (
+        Follow.query.filter_by(follower_id=user.id).first()
+        or Follow.query.filter_by(following_id=user.id).first()
+    )
+    if contact:
+        other_id = (
+            contact.following_id if contact.follower_id == user.id else contact.follower_id
+        )
+        pages.append(f"/api/chat/{other_id}/messages?after=0")
+    elif Message.query.first() is None:
+        print("Aviso: sem mensagens no banco; consultas do chat podem não aparecer.")
+    return pages
+
+
+def _capture_selects(app, user: User) -> dict[str, object]:
+    statements: dict[str, object] = {}
+
+    def remember(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.setdefault(statement, parameters)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+
+    event.listen(db.engine, "before_cursor_execute", remember)
+    try:
+        for page in _pages(user):
+            response = client.get(page)
+            if response.status_code >= 400:
+                print(f"Aviso: {page} respondeu {response.status_code}.")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", remember)
+    return statements
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--planner-default",
+        action="store_true",
+        help="não desliga enable_seqscan (usa o custo normal do planner)",
+    )
+    parser.add_argument(
+        "--ignore",
+        action="append",
+        default=[],
+        metavar="TABELA",
+        help="tabela cujo seq scan é aceitável (pode repetir)",
+    )
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != "postgresql":
+            print("EXPLAIN só é suportado com PostgreSQL.")
+            return 2
+        user = _sample_user()
+        if user is None:
+            print("Banco vazio: rode scripts/mock_actions.py antes.")
+            return 2
+        statements = _capture_selects(app, user)
+
+        offenders = 0
+        with db.engine.connect() as connection:
+            with connection.begin():
+                if not args.planner_default:
+                    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+                for statement, parameters in statements.items():
+                    plan = connection.exec_driver_sql(
+                        "EXPLAIN " + statement, parameters
+                    ).scalars().all()
+                    tables = sorted(
+                        {
+                            match.group(1)
+                            for line in plan
+                            for match in SEQ_SCAN.finditer(line)
+                        }
+                        - set(args.ignore)
+                    )
+                    if not tables:
+                        continue
+                    offenders += 1
+                    print(f"\nSeq Scan em {', '.join(tables)}:")
+                    print("  " + " ".join(statement.split())[:300])
+                    print("\n".join("    " + line for line in plan))
+
+        print(
+            f"\n{len(statements)} consultas analisadas como {user.username}; "
+            f"{offenders} com seq scan."
+        )
+    return 1 if offenders else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--docker":
+        try:
+            subprocess.run(
+                ["docker", "compose", "exec", "web", "python", "scripts/explain_queries.py"]
+                + sys.argv[2:],
+                check=True,
+            )
+        except subprocess.CalledProcessError as exc:
+            sys.exit(exc.returncode)
+        sys.exit(0)
+
+    raise SystemExit(main())
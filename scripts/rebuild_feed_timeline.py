@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Rebuild the materialized feed timeline (feed_entries) from follows and reviews."""
+
+from pathlib import Path
+import subprocess
+import sys
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from app import create_app, db
+from app.migrations import pending_migrations
+from app.timeline import rebuild_timelines
+
+
+def main() -> int:
+    app = create_app()
+    with app.app_context():
+        pending = pending_migrations()
+        if pending:
+            print(
+                f"Há {len(pending)} migração(ões) pendente(s): "
+                "rode scripts/upgrade_schema.py antes de reconstruir a timeline.",
+                file=sys.stderr,
+            )
+            return 1
+        total = rebuild_timelines()
+        db.session.commit()
+    print(f"Timeline reconstruída: {total} entradas.")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "--docker":
+        try:
+            subprocess.run(
+                ["docker", "compose", "exec", "web", "python", "scripts/rebuild_feed_timeline.py"],
+                check=True,
+            )
+        except subprocess.CalledProcessError as exc:
+            sys.exit(exc.returncode)
+        sys.exit(0)
+
+    raise SystemExit(main())
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Recompute like/dislike counters, album stats and the conversation summaries."""
+
+from pathlib import Path
+import subprocess
+import sys
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from app import create_app, db
+from app.catalog import reconcile_album_stats
+from app.counters import reconcile_conversations, reconcile_reaction_counters
+
+
+def main() -> int:
+    app = create_app()
+    with app.app_context():
+        reconcile_reaction_counters()
+        reconcile_album_stats()
+        reconcile_conversations()
+        db.session.commit()
+    print("Contadores de reações, estatísticas de álbuns e resumos de conversas recalculados.")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "--docker":
+        try:
+            subprocess.run(
+                ["docker", "compose", "exec", "web", "python", "scripts/reconcile_counters.py"],
+                check=True,
+            )
+        except subprocess.CalledProcessError as exc:
+            sys.exit(exc.returncode)
+        sys.exit(0)
+
+    raise SystemExit(main())
@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
-"""Ensure database schema has latest columns required by the app."""
+"""Apply pending versioned schema migrations (see app/migrations.py)."""
 
 from pathlib import Path
-from textwrap import dedent
 import subprocess
 
 import sys
@@ -11,47 +10,37 @@ BASE_DIR = Path(__file__).resolve().parents[1]
 if str(BASE_DIR) not in sys.path:
     sys.path.insert(0, str(BASE_DIR))
 
-from sqlalchemy import text
+from app import create_app
+from app.migrations import current_version, migrate, pending_migrations
 
-from app import create_app, db
 
-
-STATEMENTS = (
-    """
-    ALTER TABLE users
-    ADD COLUMN IF NOT EXISTS is_admin BOOLEAN NOT NULL DEFAULT FALSE;
-    """,
-    """
-    ALTER TABLE albums
-    ADD COLUMN IF NOT EXISTS personal_cover_url VARCHAR(512) NOT NULL DEFAULT '';
-    """,
-    """
-    ALTER TABLE chat_read_states
-    ADD COLUMN IF NOT EXISTS last_read_at TIMESTAMP NULL;
-    """,
-)
-
-
-def main() -> int:
+def main(argv: list[str]) -> int:
     app = create_app()
     with app.app_context():
-        for statement in STATEMENTS:
-            sql = text(dedent(statement).strip())
-            db.session.execute(sql)
-        db.session.commit()
-    print("Schema atualizado com sucesso.")
+        if "--status" in argv:
+            print(f"Versão do schema: {current_version()}")
+            for migration in pending_migrations():
+                print(f"Pendente: {migration.version:03d} {migration.name}")
+            return 0
+        applied = migrate()
+        version = current_version()
+    if applied:
+        print(f"Schema atualizado com sucesso (versão {version}).")
+    else:
+        print(f"Schema já está na versão {version}.")
     return 0
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 2 and sys.argv[1] == "--docker":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--docker":
         try:
             subprocess.run(
-                ["docker", "compose", "exec", "web", "python", "scripts/upgrade_schema.py"],
+                ["docker", "compose", "exec", "web", "python", "scripts/upgrade_schema.py"]
+                + sys.argv[2:],
                 check=True,
             )
         except subprocess.CalledProcessError as exc:
             sys.exit(exc.returncode)
         sys.exit(0)
 
-    raise SystemExit(main())
+    raise SystemExit(main(sys.argv[1:]))